@@ -0,0 +1,177 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import path
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from ingredients.catalog import ingredient_catalog
+from recipes.models import Recipe
+from . import recipes_cache
+from .recipes_serializers import RecipeSerializer
+from .recipes_views import RecipeViewSet
+from .viewer_state import get_viewer_state
+
+# Параметры, с которыми список рецептов строится асинхронно; поиск,
+# сортировка и курсор обрабатываются синхронным RecipeViewSet
+LIST_PARAMS = {"limit", "offset", "author", "tags", "is_favorited", "is_in_shopping_cart"}
+
+
+def _json(data):
+    response = HttpResponse(JSONRenderer().render(data), content_type="application/json")
+    patch_vary_headers(response, ["Accept"])
+    return response
+
+
+# Запрос DRF с пользователем, которого определили классы аутентификации
+# из настроек (как в синхронных представлениях). None — учётные данные не
+# подошли: такой запрос отдаётся синхронному представлению, чтобы ответ
+# об ошибке был тем же, что у DRF.
+async def _authenticate(request):
+    drf_request = Request(
+        request,
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    try:
+        await sync_to_async(lambda: drf_request.user)()
+    except APIException:
+        return None
+    return drf_request
+
+
+async def _serialize(recipes, drf_request, many=False):
+    # Флаги зрителя загружаются до сериализации, а сама сериализация
+    # (справочник тегов, ссылки на изображения) идёт в потоке
+    await sync_to_async(get_viewer_state)(drf_request)
+    serializer = RecipeSerializer(recipes, many=many, context={"request": drf_request})
+    return await sync_to_async(lambda: serializer.data)()
+
+
+# Фильтры, сортировка и пагинация берутся из RecipeViewSet, поэтому страница
+# совпадает с синхронным ответом
+def _recipe_list_page(drf_request):
+    view = RecipeViewSet(
+        request=drf_request, args=(), kwargs={}, format_kwarg=None, action="list"
+    )
+    return view, view.paginate_queryset(view.filter_queryset(view.get_queryset()))
+
+
+async def _recipe_list_data(drf_request):
+    view, recipes = await sync_to_async(_recipe_list_page)(drf_request)
+    data = await _serialize(recipes, drf_request, many=True)
+    return view.get_paginated_response(data).data
+
+
+async def recipe_list(request):
+    if request.method != "GET" or set(request.GET) - LIST_PARAMS:
+        return None
+    drf_request = await _authenticate(request)
+    if drf_request is None:
+        return None
+    if drf_request.user.is_authenticated:
+        return _json(await _recipe_list_data(drf_request))
+    return await recipes_cache.acached_response(
+        request,
+        await recipes_cache.alist_key(request),
+        lambda: _recipe_list_data(drf_request),
+        _json,
+    )
+
+
+async def _recipe_detail_data(drf_request, pk):
+    recipe = await Recipe.objects.with_related().filter(pk=pk).afirst()
+    if recipe is None:
+        return None
+    return await _serialize(recipe, drf_request)
+
+
+async def recipe_detail(request, pk):
+    if request.method != "GET":
+        return None
+    drf_request = await _authenticate(request)
+    if drf_request is None:
+        return None
+    if drf_request.user.is_authenticated:
+        data = await _recipe_detail_data(drf_request, pk)
+        return None if data is None else _json(data)
+    return await recipes_cache.acached_response(
+        request,
+        await recipes_cache.adetail_key(request, pk),
+        lambda: _recipe_detail_data(drf_request, pk),
+        _json,
+    )
+
+
+async def recipe_get_link(request, pk):
+    if request.method != "GET" or await _authenticate(request) is None:
+        return None
+    code = (
+        await Recipe.objects.filter(pk=pk).values_list("short_code", flat=True).afirst()
+    )
+    if code is None:
+        return None
+    return _json({"short-link": request.build_absolute_uri(f"/s/{code}")})
+
+
+async def ingredient_list(request):
+    if request.method != "GET" or await _authenticate(request) is None:
+        return None
+    name = request.GET.get("name")
+    if name:
+        items = await sync_to_async(ingredient_catalog.search)(
+            name, settings.INGREDIENT_SEARCH_LIMIT
+        )
+    else:
+        items = await sync_to_async(ingredient_catalog.search)("")
+    return _json(items)
+
+
+async def avatar(request):
+    if request.method != "GET":
+        return None
+    drf_request = await _authenticate(request)
+    if drf_request is None or drf_request.user.is_anonymous:
+        return None
+    user = drf_request.user
+    if not user.avatar:
+        return _json({"avatar": None})
+    return _json({"avatar": request.build_absolute_uri(user.avatar.url)})
+
+
+# Асинхронный обработчик с запасным синхронным представлением: всё, что
+# обработчик не берёт на себя (вернул None), выполняет представление DRF
+def _with_fallback(handler, fallback):
+    sync_fallback = sync_to_async(fallback)
+
+    async def view(request, *args, **kwargs):
+        response = await handler(request, *args, **kwargs)
+        if response is None:
+            response = await sync_fallback(request, *args, **kwargs)
+        return response
+
+    # Метрики подписывают запрос представлением DRF и его действием
+    view.cls, view.actions = fallback.cls, fallback.actions
+    return csrf_exempt(view)
+
+
+# Маршруты для запуска под ASGI; подключаются перед маршрутами роутера DRF,
+# синхронные представления берутся из него по имени
+def urlpatterns(router):
+    views = {}
+    for pattern in router.urls:
+        views.setdefault(pattern.name, pattern.callback)
+    routes = [
+        ("recipes/", recipe_list, "recipes-list"),
+        ("recipes/<int:pk>/", recipe_detail, "recipes-detail"),
+        ("recipes/<int:pk>/get-link/", recipe_get_link, "recipes-get-link"),
+        ("ingredients/", ingredient_list, "ingredients-list"),
+        ("users/me/avatar/", avatar, "users-avatar"),
+    ]
+    return [
+        path(route, _with_fallback(handler, views[name]), name=name)
+        for route, handler, name in routes
+    ]
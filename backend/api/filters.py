@@ -0,0 +1,30 @@
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+from recipes import search
+
+
+# Полнотекстовый поиск рецептов по параметру search. Без параметра ordering
+# выдача сортируется по релевантности, поэтому фильтр ставится после
+# OrderingFilter. Если база не поддерживает индекс, работает как SearchFilter.
+class RecipeSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, "").strip()
+        if not text:
+            return queryset
+        found = search.filter_recipes(queryset, text)
+        if found is None:
+            return super().filter_queryset(request, queryset, view)
+        if request.query_params.get(OrderingFilter.ordering_param):
+            return found
+        return found.order_by("search_rank", "-id")
+
+
+# Сортировка с id последним ключом: у рецептов с одинаковым рейтингом
+# порядок не меняется между страницами, и сортировка совпадает с индексами
+# (-created, -id), (-popularity, -id), (-trending, -id)
+class StableOrderingFilter(OrderingFilter):
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering or ordering[-1].lstrip("-") in ("id", "pk"):
+            return ordering
+        return [*ordering, "-id" if ordering[-1].startswith("-") else "id"]
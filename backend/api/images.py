@@ -0,0 +1,288 @@
+import base64
+import binascii
+import io
+import logging
+import posixpath
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from recipes.models import Recipe
+from . import recipes_cache, stored_files
+from .stored_files import FILE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+SPOOL_CHUNK_SIZE = 64 * 1024
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+# Форматы вариантов: WebP для современных клиентов, JPEG как запасной
+VARIANT_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+# Размеры вариантов: (ширина, высота, обрезать до точного размера)
+RECIPE_VARIANTS = {"card": (480, 320, True), "detail": (1200, 800, False)}
+AVATAR_VARIANTS = {"small": (64, 64, True), "medium": (200, 200, True)}
+VARIANT_SIZES = {"recipe": RECIPE_VARIANTS, "avatar": AVATAR_VARIANTS}
+# Вид изображения: (модель, поле с файлом, поле с вариантами, размеры)
+KINDS = {
+    kind: (*fields, VARIANT_SIZES[kind]) for kind, fields in FILE_FIELDS.items()
+}
+
+
+class ImagePipelineBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Сервер перегружен загрузкой изображений, повторите позже."
+    default_code = "image_pipeline_busy"
+
+
+# Декодирование и проверка выполняются в ограниченном пуле: одновременно
+# разбирается не больше IMAGE_DECODE_WORKERS изображений, ещё столько же
+# ждут в очереди, остальные запросы получают 503.
+_decode_pool = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_DECODE_WORKERS, thread_name_prefix="image-decode"
+)
+_decode_slots = threading.BoundedSemaphore(settings.IMAGE_DECODE_WORKERS * 2)
+
+
+# Декодирует base64 по частям во временный файл, который уходит на диск,
+# когда превышает IMAGE_SPOOL_MAX_MEMORY. В памяти остаётся только буфер.
+class Base64Spool:
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(
+            max_size=settings.IMAGE_SPOOL_MAX_MEMORY
+        )
+        self.size = 0
+        self._tail = ""
+
+    def write(self, text):
+        text = self._tail + "".join(text.split())
+        end = len(text) // 4 * 4
+        self._tail = text[end:]
+        try:
+            chunk = base64.b64decode(text[:end], validate=True)
+        except binascii.Error:
+            self.file.close()
+            raise ValueError("некорректная строка base64")
+        self.size += len(chunk)
+        if self.size > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.file.close()
+            raise ValueError(
+                f"файл больше {settings.IMAGE_UPLOAD_MAX_SIZE // 1024 // 1024} МБ"
+            )
+        self.file.write(chunk)
+
+    def close(self):
+        if self._tail:
+            self.file.close()
+            raise ValueError("некорректная строка base64")
+        self.file.seek(0)
+        return self.file
+
+
+def _spool_data_uri(data):
+    _, separator, encoded = data.partition(";base64,")
+    if not separator:
+        raise ValueError("ожидается изображение в формате data:image/...;base64,")
+    spool = Base64Spool()
+    for start in range(0, len(encoded), SPOOL_CHUNK_SIZE):
+        spool.write(encoded[start:start + SPOOL_CHUNK_SIZE])
+    return spool.close()
+
+
+def _decode(file):
+    file.seek(0)
+    try:
+        image = Image.open(file)
+    except UnidentifiedImageError:
+        raise ValueError("файл не является изображением")
+    with image:
+        if image.format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"формат {image.format} не поддерживается")
+        if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+            raise ValueError("слишком большое разрешение")
+        image.verify()
+        extension = FORMAT_EXTENSIONS[image.format]
+    file.seek(0)
+    return File(file, name=f"{uuid.uuid4().hex}.{extension}")
+
+
+# Принимает строку data:image/...;base64, или загруженный файл: из multipart
+# или из строки base64, которую StreamingJSONParser уже выгрузил во временный файл
+def decode_image(data):
+    if not isinstance(data, (str, UploadedFile)):
+        raise serializers.ValidationError(
+            "Изображение должно быть строкой base64 или файлом."
+        )
+    if not _decode_slots.acquire(timeout=settings.IMAGE_DECODE_TIMEOUT):
+        raise ImagePipelineBusy()
+    try:
+        file = _spool_data_uri(data) if isinstance(data, str) else data
+        return _decode_pool.submit(_decode, file).result()
+    except (ValueError, OSError, binascii.Error, Image.DecompressionBombError) as error:
+        raise serializers.ValidationError(f"Ошибка обработки изображения: {error}")
+    finally:
+        _decode_slots.release()
+
+
+def _resize(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def _convert(image, image_format):
+    has_alpha = image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+    if not has_alpha:
+        return image.convert("RGB")
+    image = image.convert("RGBA")
+    if image_format != "JPEG":
+        return image
+    background = Image.new("RGB", image.size, "white")
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+# Строит варианты изображения и сохраняет их пути вместе с именем исходного
+# файла. Если исходный файл успели заменить, результат не сохраняется,
+# а записанные файлы без ссылок удалит сборщик мусора.
+def build_variants(kind, pk):
+    model_label, field, variants_field, sizes = KINDS[kind]
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only(field, variants_field).first()
+    if instance is None or not getattr(instance, field):
+        return
+    source = getattr(instance, field).name
+    previous = getattr(instance, variants_field)
+    base = posixpath.splitext(posixpath.basename(source))[0]
+    directory = posixpath.join(posixpath.dirname(source), "variants")
+
+    variants = {"source": source, "sizes": {}}
+    with default_storage.open(source, "rb") as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        for size_name, (width, height, crop) in sizes.items():
+            resized = _resize(image, width, height, crop)
+            for extension, (image_format, options) in VARIANT_FORMATS.items():
+                buffer = io.BytesIO()
+                _convert(resized, image_format).save(buffer, image_format, **options)
+                path = default_storage.save(
+                    f"{directory}/{base}_{size_name}.{extension}",
+                    ContentFile(buffer.getvalue()),
+                )
+                variants["sizes"].setdefault(size_name, {})[extension] = path
+
+    with transaction.atomic():
+        if not model.objects.filter(pk=pk, **{field: source}).update(
+            **{variants_field: variants}
+        ):
+            return
+        # update() не отправляет сигналы, поэтому ссылки учитываем сами
+        new = stored_files.variant_names(variants)
+        old = stored_files.variant_names(previous)
+        stored_files.acquire(new - old)
+        stored_files.release(old - new)
+    _invalidate_cached_recipes(kind, pk)
+
+
+def _invalidate_cached_recipes(kind, pk):
+    if kind == "recipe":
+        recipes_cache.invalidate([pk])
+    else:
+        recipes_cache.invalidate(
+            list(Recipe.objects.filter(author_id=pk).values_list("id", flat=True))
+        )
+
+
+# Локальная замена брокера очередей: задачи выполняются пулом потоков
+# текущего процесса. Брокер задаётся настройкой IMAGE_BROKER.
+class LocalBroker:
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_TASK_WORKERS, thread_name_prefix="image-task"
+        )
+
+    def _run(self, task, args):
+        try:
+            task(*args)
+        except Exception:
+            logger.exception("Ошибка фоновой задачи %s%r", task.__name__, args)
+        finally:
+            connections.close_all()
+
+    def enqueue(self, task, *args):
+        self._executor.submit(self._run, task, args)
+
+
+# Выполняет задачи сразу в вызывающем потоке (команды управления, отладка)
+class ImmediateBroker:
+    def enqueue(self, task, *args):
+        task(*args)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.IMAGE_BROKER)()
+    return _broker
+
+
+def schedule_variants(kind, pk):
+    transaction.on_commit(lambda: get_broker().enqueue(build_variants, kind, pk))
+
+
+# Сбрасывает варианты; ссылки на их файлы снимаются при сохранении экземпляра
+def discard_variants(instance, kind):
+    _, _, variants_field, _ = KINDS[kind]
+    setattr(instance, variants_field, {})
+
+
+def variant_urls(instance, kind, request=None):
+    _, field, variants_field, _ = KINDS[kind]
+    image = getattr(instance, field)
+    variants = getattr(instance, variants_field) or {}
+    # Варианты старого файла не отдаём, пока не построены новые
+    if not image or variants.get("source") != image.name:
+        return None
+    urls = {}
+    for size_name, paths in variants["sizes"].items():
+        urls[size_name] = {}
+        for extension, path in paths.items():
+            url = default_storage.url(path)
+            urls[size_name][extension] = (
+                request.build_absolute_uri(url) if request is not None else url
+            )
+    return urls
+
+
+# Ссылки на уменьшенные копии изображения; null, пока они не готовы
+class ImageVariantsField(serializers.Field):
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        kwargs.setdefault("source", "*")
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return variant_urls(instance, self.kind, self.context.get("request"))
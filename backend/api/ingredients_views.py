@@ -1,4 +1,7 @@
+from django.conf import settings
 from rest_framework import viewsets
+from rest_framework.response import Response
+from ingredients.catalog import ingredient_catalog
 from ingredients.models import Ingredient
 from .ingredients_serializers import IngredientSerializer
 
@@ -8,9 +11,13 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     pagination_class = None
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        name = self.request.query_params.get("name")
+    def list(self, request, *args, **kwargs):
+        # Подсказки при вводе отдаются из справочника в памяти, без запросов к БД.
+        # Справочник сравнивает названия через str.lower, поэтому регистр
+        # кириллицы не важен, в отличие от LOWER в SQLite.
+        name = request.query_params.get("name")
         if name:
-            return queryset.filter(name__istartswith=name)
-        return queryset
+            return Response(
+                ingredient_catalog.search(name, settings.INGREDIENT_SEARCH_LIMIT)
+            )
+        return Response(ingredient_catalog.search(""))
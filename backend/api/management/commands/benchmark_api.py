@@ -0,0 +1,719 @@
+import csv
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import viewer_state
+from ingredients.models import Ingredient
+from recipes import (
+    counters,
+    ranking,
+    search,
+    shopping_list,
+    short_links,
+    timelines,
+)
+from recipes.catalog import tag_catalog
+from recipes.cookable import cookable_index
+from recipes.models import Favorite, IngredientRecipe, Recipe, ShoppingCart, Tag
+from users.models import Subscription, User
+
+BASELINE_PATH = os.path.normpath(
+    os.path.join(os.path.dirname(__file__), "../../benchmarks/query_baseline.json")
+)
+# data/ монтируется в backend/ в контейнере и лежит в корне репозитория локально
+INGREDIENTS_PATHS = (
+    os.path.join(settings.BASE_DIR, "data", "ingredients.csv"),
+    os.path.join(settings.BASE_DIR.parent, "data", "ingredients.csv"),
+)
+PASSWORD = "benchmark-password"
+TAGS = (
+    ("Завтрак", "#E26C2D", "breakfast"),
+    ("Обед", "#49B64E", "lunch"),
+    ("Ужин", "#8775D2", "dinner"),
+)
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAACVBMVEUAAAD"
+    "///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAAggCByxOyYQAAAABJRU5ErkJggg=="
+)
+
+# Маршруты, которые требуют почтовых сценариев и в бенчмарк не входят
+SKIPPED_ROUTES = {
+    "users-activation",
+    "users-resend-activation",
+    "users-reset-password",
+    "users-reset-password-confirm",
+    "users-reset-username",
+    "users-reset-username-confirm",
+    "users-set-username",
+    "api-root",
+}
+
+# name, route, method, path, client, data, paged
+CASES = [
+    ("recipes-list-anon", "recipes-list", "get", "/api/recipes/", "anon", None, True),
+    ("recipes-list", "recipes-list", "get", "/api/recipes/", "viewer", None, True),
+    (
+        "recipes-list-favorited",
+        "recipes-list",
+        "get",
+        "/api/recipes/?is_favorited=1",
+        "viewer",
+        None,
+        True,
+    ),
+    (
+        "recipes-list-in-cart",
+        "recipes-list",
+        "get",
+        "/api/recipes/?is_in_shopping_cart=1",
+        "viewer",
+        None,
+        True,
+    ),
+    (
+        "recipes-list-author",
+        "recipes-list",
+        "get",
+        "/api/recipes/?author={followed}",
+        "viewer",
+        None,
+        True,
+    ),
+    (
+        "recipes-list-tags",
+        "recipes-list",
+        "get",
+        "/api/recipes/?tags=breakfast&tags=dinner",
+        "anon",
+        None,
+        True,
+    ),
+    (
+        "recipes-search",
+        "recipes-list",
+        "get",
+        "/api/recipes/?search=benchmark",
+        "viewer",
+        None,
+        True,
+    ),
+    ("recipes-feed", "recipes-feed", "get", "/api/recipes/feed/", "viewer", None, True),
+    (
+        "recipes-list-popular",
+        "recipes-list",
+        "get",
+        "/api/recipes/?ordering=-popularity",
+        "viewer",
+        None,
+        True,
+    ),
+    (
+        "recipes-trending",
+        "recipes-trending",
+        "get",
+        "/api/recipes/trending/",
+        "anon",
+        None,
+        True,
+    ),
+    (
+        "recipes-create",
+        "recipes-list",
+        "post",
+        "/api/recipes/",
+        "viewer",
+        "recipe",
+        False,
+    ),
+    (
+        "recipes-detail",
+        "recipes-detail",
+        "get",
+        "/api/recipes/{recipe}/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "recipes-update",
+        "recipes-detail",
+        "patch",
+        "/api/recipes/{own_recipe}/",
+        "viewer",
+        "recipe",
+        False,
+    ),
+    (
+        "recipes-delete",
+        "recipes-detail",
+        "delete",
+        "/api/recipes/{own_recipe}/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "recipes-favorite-add",
+        "recipes-favorite",
+        "post",
+        "/api/recipes/{recipe}/favorite/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "recipes-favorite-remove",
+        "recipes-favorite",
+        "delete",
+        "/api/recipes/{favorite_recipe}/favorite/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "recipes-cart-add",
+        "recipes-shopping-cart",
+        "post",
+        "/api/recipes/{recipe}/shopping_cart/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "recipes-cart-remove",
+        "recipes-shopping-cart",
+        "delete",
+        "/api/recipes/{cart_recipe}/shopping_cart/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "recipes-cart-download",
+        "recipes-download-shopping-cart",
+        "get",
+        "/api/recipes/download_shopping_cart/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "recipes-cart-view",
+        "recipes-view-shopping-cart",
+        "get",
+        "/api/recipes/view_shopping_cart/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "recipes-cookable",
+        "recipes-cookable",
+        "get",
+        "/api/recipes/cookable/?ingredients={pantry}",
+        "viewer",
+        None,
+        True,
+    ),
+    (
+        "recipes-get-link",
+        "recipes-get-link",
+        "get",
+        "/api/recipes/{recipe}/get-link/",
+        "anon",
+        None,
+        False,
+    ),
+    ("short-link", "short-link", "get", "/s/{short_code}", "anon", None, False),
+    ("tags-list", "tags-list", "get", "/api/tags/", "anon", None, False),
+    ("tags-detail", "tags-detail", "get", "/api/tags/{tag}/", "anon", None, False),
+    (
+        "ingredients-search",
+        "ingredients-list",
+        "get",
+        "/api/ingredients/?name=са",
+        "anon",
+        None,
+        False,
+    ),
+    (
+        "ingredients-detail",
+        "ingredients-detail",
+        "get",
+        "/api/ingredients/{ingredient}/",
+        "anon",
+        None,
+        False,
+    ),
+    ("users-list", "users-list", "get", "/api/users/", "viewer", None, True),
+    (
+        "users-create",
+        "users-list",
+        "post",
+        "/api/users/",
+        "anon",
+        "signup",
+        False,
+    ),
+    (
+        "users-detail",
+        "users-detail",
+        "get",
+        "/api/users/{followed}/",
+        "viewer",
+        None,
+        False,
+    ),
+    ("users-me", "users-me", "get", "/api/users/me/", "viewer", None, False),
+    (
+        "users-subscriptions",
+        "users-subscriptions",
+        "get",
+        "/api/users/subscriptions/",
+        "viewer",
+        None,
+        True,
+    ),
+    (
+        "users-subscriptions-limited",
+        "users-subscriptions",
+        "get",
+        "/api/users/subscriptions/?recipes_limit=3",
+        "viewer",
+        None,
+        True,
+    ),
+    (
+        "users-subscribe",
+        "users-subscribe",
+        "post",
+        "/api/users/{author}/subscribe/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "users-unsubscribe",
+        "users-subscribe",
+        "delete",
+        "/api/users/{followed}/subscribe/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "users-avatar-get",
+        "users-avatar",
+        "get",
+        "/api/users/me/avatar/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "users-avatar-put",
+        "users-avatar",
+        "put",
+        "/api/users/me/avatar/",
+        "viewer",
+        "avatar",
+        False,
+    ),
+    (
+        "users-avatar-delete",
+        "users-avatar",
+        "delete",
+        "/api/users/me/avatar/",
+        "viewer",
+        None,
+        False,
+    ),
+    (
+        "users-set-password",
+        "users-set-password",
+        "post",
+        "/api/users/set_password/",
+        "viewer",
+        "password",
+        False,
+    ),
+    (
+        "auth-token-login",
+        "login",
+        "post",
+        "/api/auth/token/login/",
+        "anon",
+        "login",
+        False,
+    ),
+    (
+        "auth-token-logout",
+        "logout",
+        "post",
+        "/api/auth/token/logout/",
+        "viewer",
+        None,
+        False,
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет тестовую БД реалистичным набором данных и замеряет число "
+        "SQL-запросов, время и размер ответа для каждого маршрута API"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--recipes", type=int, default=3000)
+        parser.add_argument("--ingredients-per-recipe", type=int, default=8)
+        parser.add_argument("--subscriptions", type=int, default=30)
+        parser.add_argument("--favorites", type=int, default=40)
+        parser.add_argument("--cart", type=int, default=15)
+        parser.add_argument(
+            "--page-sizes",
+            default="6,30",
+            help="Размеры страниц для постраничных маршрутов, через запятую",
+        )
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--only", help="Запускать только сценарии с этой подстрокой")
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Записать текущее число запросов как базовое",
+        )
+        parser.add_argument("--report", help="Сохранить результаты в JSON-файл")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options["seed"])
+        page_sizes = [int(size) for size in options["page_sizes"].split(",")]
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root,
+                PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+            ):
+                started = time.perf_counter()
+                context = self.seed()
+                self.stdout.write(
+                    f"Данные подготовлены за {time.perf_counter() - started:.1f} с"
+                )
+                results = self.run_cases(context, page_sizes)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results)
+        self.check_coverage()
+        failures = self.check_results(results, page_sizes)
+
+        if options["report"]:
+            with open(options["report"], "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+        if options["update_baseline"]:
+            self.write_baseline(results)
+        elif failures:
+            raise CommandError("\n".join(failures))
+
+    def seed(self):
+        opts = self.options
+        rnd = self.random
+
+        path = next(path for path in INGREDIENTS_PATHS if os.path.exists(path))
+        with open(path, encoding="utf-8") as f:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in csv.reader(f)
+            )
+        ingredient_ids = list(Ingredient.objects.values_list("id", flat=True))
+
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            User(
+                email=f"user{i}@bench.local",
+                username=f"user{i}",
+                first_name=f"Имя{i}",
+                last_name=f"Фамилия{i}",
+                password=password,
+                avatar=f"avatars/user{i}.png",
+            )
+            for i in range(opts["users"])
+        )
+        user_ids = list(User.objects.order_by("id").values_list("id", flat=True))
+
+        Recipe.objects.bulk_create(
+            Recipe(
+                author_id=rnd.choice(user_ids),
+                name=f"Рецепт benchmark {i}",
+                text="Описание рецепта " * 20,
+                cooking_time=rnd.randint(5, 120),
+                image=f"recipes/recipe{i}.png",
+            )
+            for i in range(opts["recipes"])
+        )
+        recipe_ids = list(Recipe.objects.values_list("id", flat=True))
+
+        IngredientRecipe.objects.bulk_create(
+            (
+                IngredientRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                                 amount=rnd.randint(1, 500))
+                for recipe_id in recipe_ids
+                for ingredient_id in rnd.sample(
+                    ingredient_ids, opts["ingredients_per_recipe"]
+                )
+            ),
+            batch_size=5000,
+        )
+
+        Tag.objects.bulk_create(
+            Tag(name=name, color=color, slug=slug) for name, color, slug in TAGS
+        )
+        tag_ids = list(Tag.objects.values_list("id", flat=True))
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in rnd.sample(tag_ids, rnd.randint(1, 2))
+            ),
+            batch_size=5000,
+        )
+
+        def pairs(model, field, targets, per_user):
+            model.objects.bulk_create(
+                (
+                    model(user_id=user_id, **{field: target})
+                    for user_id in user_ids
+                    for target in rnd.sample(targets, per_user)
+                    if target != user_id or field != "author_id"
+                ),
+                batch_size=5000,
+            )
+
+        pairs(Subscription, "author_id", user_ids, opts["subscriptions"])
+        pairs(Favorite, "recipe_id", recipe_ids, opts["favorites"])
+        pairs(ShoppingCart, "recipe_id", recipe_ids, opts["cart"])
+
+        viewer = User.objects.get(id=user_ids[0])
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=viewer,
+                name=f"Свой рецепт {i}",
+                text="Описание",
+                cooking_time=10,
+                image="recipes/own.png",
+            )
+            for i in range(2)
+        )
+        # bulk_create не отправляет сигналы: выставляем счётчики, строим индекс
+        # поиска, списки покупок, коды коротких ссылок, ленты подписок и рейтинги
+        counters.reconcile()
+        search.rebuild()
+        shopping_list.rebuild()
+        short_links.assign_codes()
+        timelines.rebuild()
+        ranking.recompute()
+        # Справочники и индексы в памяти загружаются процессом один раз,
+        # а состояние зрителя берётся из кеша, а не на каждый запрос
+        search.filter_recipes(Recipe.objects.all(), "benchmark").exists()
+        cookable_index.rank([])
+        tag_catalog.all()
+        viewer_state.fetch(viewer.pk)
+        followed = viewer.subscriptions_set.values_list("author_id", flat=True)
+        return {
+            "viewer": viewer,
+            "recipe": Recipe.objects.exclude(in_favorites__user=viewer)
+            .exclude(in_shopping_cart__user=viewer)
+            .exclude(author=viewer)
+            .values_list("id", flat=True)
+            .first(),
+            "short_code": Recipe.objects.values_list("short_code", flat=True).first(),
+            "own_recipe": viewer.recipes.values_list("id", flat=True).first(),
+            "favorite_recipe": viewer.favorites.values_list("recipe_id", flat=True)[0],
+            "cart_recipe": viewer.shopping_cart.values_list("recipe_id", flat=True)[0],
+            "followed": followed[0],
+            "author": User.objects.exclude(id__in=followed)
+            .exclude(id=viewer.id)
+            .values_list("id", flat=True)
+            .first(),
+            "ingredient": ingredient_ids[0],
+            "tag": tag_ids[0],
+            # Ингредиенты первых рецептов, чтобы часть выдачи была готова целиком
+            "pantry": ",".join(
+                map(
+                    str,
+                    IngredientRecipe.objects.filter(recipe_id__in=recipe_ids[:5])
+                    .values_list("ingredient_id", flat=True)
+                    .distinct(),
+                )
+            ),
+            "ingredient_ids": ingredient_ids,
+        }
+
+    def payload(self, kind, context):
+        if kind == "recipe":
+            return {
+                "name": "Новый рецепт",
+                "text": "Описание",
+                "cooking_time": 15,
+                "image": IMAGE,
+                "ingredients": [
+                    {"id": ingredient_id, "amount": 10}
+                    for ingredient_id in context["ingredient_ids"][:20]
+                ],
+            }
+        if kind == "signup":
+            return {
+                "email": "new@bench.local",
+                "username": "new_user",
+                "first_name": "Новый",
+                "last_name": "Пользователь",
+                "password": "Sup3r-secret-pass",
+            }
+        if kind == "avatar":
+            return {"avatar": IMAGE}
+        if kind == "password":
+            return {"current_password": PASSWORD, "new_password": "An0ther-secret-pass"}
+        if kind == "login":
+            return {"email": context["viewer"].email, "password": PASSWORD}
+        return None
+
+    def clients(self, context):
+        # Ошибка в одном маршруте не должна прерывать весь прогон
+        anon = APIClient(raise_request_exception=False)
+        viewer = APIClient(raise_request_exception=False)
+        token, _ = Token.objects.get_or_create(user=context["viewer"])
+        viewer.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        return {"anon": anon, "viewer": viewer}
+
+    def measure(self, client, method, path, data):
+        timings = []
+        for _ in range(self.options["repeat"]):
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = getattr(client, method)(path, data=data, format="json")
+                    if response.streaming:
+                        content = b"".join(response.streaming_content)
+                    else:
+                        content = response.content
+                    timings.append(time.perf_counter() - started)
+                # Каждый сценарий выполняется на неизменном наборе данных
+                transaction.set_rollback(True)
+        return {
+            "status": response.status_code,
+            "queries": len(queries),
+            "time_ms": round(statistics.median(timings) * 1000, 2),
+            "bytes": len(content),
+        }
+
+    def run_cases(self, context, page_sizes):
+        clients = self.clients(context)
+        results = {}
+        for name, route, method, path, client, data, paged in CASES:
+            if self.options["only"] and self.options["only"] not in name:
+                continue
+            path = path.format(**context)
+            payload = self.payload(data, context)
+            if not paged:
+                results[name] = {
+                    "route": route,
+                    **self.measure(clients[client], method, path, payload),
+                }
+                continue
+            separator = "&" if "?" in path else "?"
+            results[name] = {
+                "route": route,
+                "pages": {
+                    str(size): self.measure(
+                        clients[client],
+                        method,
+                        f"{path}{separator}limit={size}",
+                        payload,
+                    )
+                    for size in page_sizes
+                },
+            }
+        return results
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'Сценарий':40} {'Стр.':>5} {'Код':>4} {'SQL':>5} {'мс':>9} {'Байт':>9}"
+        )
+        for name, result in results.items():
+            rows = result.get("pages") or {"-": result}
+            for size, row in rows.items():
+                self.stdout.write(
+                    f"{name:40} {size:>5} {row['status']:>4} {row['queries']:>5} "
+                    f"{row['time_ms']:>9} {row['bytes']:>9}"
+                )
+
+    def check_coverage(self):
+        from foodgram_backend.urls import router
+
+        routes = {url.name for url in router.urls} | {"login", "logout"}
+        covered = {case[1] for case in CASES}
+        for route in sorted(routes - covered - SKIPPED_ROUTES):
+            self.stdout.write(
+                self.style.WARNING(f"Маршрут {route} не покрыт бенчмарком")
+            )
+
+    def check_results(self, results, page_sizes):
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH, encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        failures = []
+        for name, result in results.items():
+            rows = list(result.get("pages", {"-": result}).values())
+            counts = [row["queries"] for row in rows]
+            if any(row["status"] >= 500 for row in rows):
+                failures.append(f"{name}: ошибка сервера {rows[0]['status']}")
+            if len(set(counts)) > 1:
+                failures.append(
+                    f"{name}: число запросов растёт с размером страницы "
+                    f"{dict(zip(page_sizes, counts))}"
+                )
+            if name in baseline and max(counts) > baseline[name]:
+                failures.append(
+                    f"{name}: {max(counts)} запросов, базовое значение {baseline[name]}"
+                )
+        for failure in failures:
+            self.stderr.write(self.style.ERROR(failure))
+        return failures
+
+    def write_baseline(self, results):
+        baseline = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH, encoding="utf-8") as f:
+                baseline = json.load(f)
+        for name, result in results.items():
+            rows = result.get("pages", {"-": result}).values()
+            baseline[name] = max(row["queries"] for row in rows)
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        self.stdout.write(self.style.SUCCESS(f"Базовые значения записаны в {BASELINE_PATH}"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from api.images import KINDS, build_variants
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Строит уменьшенные копии изображений рецептов и аватаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Пересобрать и те варианты, что уже построены",
+        )
+
+    def handle(self, *args, **options):
+        for kind, model in (("recipe", Recipe), ("avatar", User)):
+            _, field, variants_field, _ = KINDS[kind]
+            rows = (
+                model.objects.exclude(**{field: ""})
+                .exclude(**{f"{field}__isnull": True})
+                .values_list("pk", field, variants_field)
+            )
+            built = failed = 0
+            for pk, name, variants in rows.iterator():
+                if not options["force"] and (variants or {}).get("source") == name:
+                    continue
+                try:
+                    build_variants(kind, pk)
+                except (OSError, ValueError) as error:
+                    failed += 1
+                    self.stderr.write(f"{kind} {pk}: {error}")
+                    continue
+                built += 1
+            self.stdout.write(
+                self.style.SUCCESS(f"{kind}: построено {built}, с ошибками {failed}")
+            )
@@ -0,0 +1,108 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import stored_files
+from api.models import StoredFile
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Удаляет файлы медиа, на которые не ссылается ни одна запись"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help="Не трогать файлы, изменённые за последние N часов",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, что будет удалено",
+        )
+        parser.add_argument(
+            "--recount",
+            action="store_true",
+            help=(
+                "Сначала пересчитать ссылки по данным моделей и удалить также "
+                "файлы, о которых база не знает"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        self.cutoff = time.time() - options["grace_hours"] * 3600
+        self.dry_run = options["dry_run"]
+        self.removed = self.freed = 0
+        if options["recount"]:
+            stored_files.recount()
+
+        names = StoredFile.objects.filter(references=0).values_list("name", flat=True)
+        for name in names.iterator():
+            if not self.expired(name):
+                continue
+            if self.dry_run:
+                self.remove(name)
+                continue
+            # Ссылка могла появиться после выборки: удаляем, только если её нет
+            with transaction.atomic():
+                if StoredFile.objects.filter(name=name, references=0).delete()[0]:
+                    self.remove(name)
+
+        if options["recount"]:
+            self.collect_untracked()
+
+        action = "будет удалено" if self.dry_run else "удалено"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Файлов {action}: {self.removed}, {self.freed / 1024 / 1024:.1f} МБ"
+            )
+        )
+
+    def expired(self, name):
+        try:
+            return os.path.getmtime(default_storage.path(name)) < self.cutoff
+        except FileNotFoundError:
+            return True
+
+    def remove(self, name):
+        try:
+            self.freed += default_storage.size(name)
+        except FileNotFoundError:
+            return
+        self.removed += 1
+        if self.dry_run:
+            self.stdout.write(name)
+        else:
+            default_storage.delete(name)
+
+    # Файлы в каталогах загрузок без записи в StoredFile: остались от
+    # прерванных запросов или сохранены до появления учёта ссылок
+    def collect_untracked(self):
+        for model_label, field, _ in stored_files.FILE_FIELDS.values():
+            upload_to = apps.get_model(model_label)._meta.get_field(field).upload_to
+            root = default_storage.path(upload_to)
+            batch = []
+            for directory, _, files in os.walk(root):
+                for file_name in files:
+                    path = os.path.join(directory, file_name)
+                    name = os.path.relpath(path, default_storage.location)
+                    batch.append(name.replace(os.sep, "/"))
+                    if len(batch) >= BATCH_SIZE:
+                        self.remove_untracked(batch)
+                        batch = []
+            self.remove_untracked(batch)
+
+    def remove_untracked(self, names):
+        tracked = set(
+            StoredFile.objects.filter(name__in=names).values_list("name", flat=True)
+        )
+        for name in names:
+            if name not in tracked and self.expired(name):
+                self.remove(name)
@@ -0,0 +1,101 @@
+import io
+import json
+import pstats
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram_backend.metrics import fingerprint
+
+
+class Command(BaseCommand):
+    help = "Показывает профили запросов, снятые foodgram_backend.profiling"
+
+    def add_arguments(self, parser):
+        parser.add_argument("id", nargs="?", help="id профиля для подробной сводки")
+        parser.add_argument("--view", help="Только профили этого представления")
+        parser.add_argument("--limit", type=int, default=20, help="Сколько профилей показать")
+        parser.add_argument("--top", type=int, default=20, help="Сколько строк в сводке")
+
+    def handle(self, *args, **options):
+        self.directory = Path(settings.PROFILING_DIR)
+        self.top = options["top"]
+        if options["id"]:
+            self.summarize(self.load(options["id"]))
+            return
+        captures = [
+            json.loads(path.read_text(encoding="utf-8"))
+            for path in sorted(self.directory.glob("*.json"), reverse=True)
+        ]
+        if options["view"]:
+            captures = [meta for meta in captures if meta["view"] == options["view"]]
+        if not captures:
+            self.stdout.write("Профилей нет")
+            return
+        for meta in captures[: options["limit"]]:
+            self.stdout.write(
+                f"{meta['id']}  {meta['duration_ms']:8.1f} мс  "
+                f"SQL: {len(meta['queries']):4d}  {meta['mode']:8s}  "
+                f"{meta['status']} {meta['method']} {meta['path']}  ({meta['view']})"
+            )
+
+    def load(self, capture_id):
+        path = self.directory / f"{capture_id}.json"
+        if not path.exists():
+            raise CommandError(f"Профиль {capture_id} не найден")
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def summarize(self, meta):
+        self.stdout.write(
+            f"{meta['method']} {meta['path']} ({meta['view']}) — {meta['status']}, "
+            f"{meta['duration_ms']} мс, {meta['created']}, "
+            f"{'по запросу' if meta['reason'] == 'requested' else 'случайная выборка'}"
+        )
+        profile = self.directory / meta["profile"]
+        self.stdout.write(f"\nПрофиль: {profile}")
+        if meta["mode"] == "sample":
+            self.summarize_samples(profile)
+        else:
+            output = io.StringIO()
+            stats = pstats.Stats(str(profile), stream=output)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(self.top)
+            self.stdout.write(output.getvalue())
+        self.summarize_queries(meta["queries"])
+
+    # Время по функциям из свёрнутых стеков: своё (функция на вершине стека)
+    # и общее (функция где-то в стеке)
+    def summarize_samples(self, profile):
+        own, total = Counter(), Counter()
+        samples = 0
+        with open(profile, encoding="utf-8") as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                frames = stack.split(";")
+                count = int(count)
+                samples += count
+                own[frames[-1]] += count
+                for frame in set(frames):
+                    total[frame] += count
+        self.stdout.write(f"Выборок: {samples}\n\nСвоё время:")
+        for frame, count in own.most_common(self.top):
+            self.stdout.write(f"{count * 100 / samples:6.1f}%  {frame}")
+        self.stdout.write("\nОбщее время:")
+        for frame, count in total.most_common(self.top):
+            self.stdout.write(f"{count * 100 / samples:6.1f}%  {frame}")
+
+    def summarize_queries(self, queries):
+        total = sum(query["time_ms"] for query in queries)
+        self.stdout.write(f"\nSQL: {len(queries)} запросов за {total:.1f} мс")
+        if not queries:
+            return
+        self.stdout.write("\nСамые долгие:")
+        for query in sorted(queries, key=lambda query: -query["time_ms"])[:5]:
+            self.stdout.write(f"{query['time_ms']:8.1f} мс  {query['sql']}")
+        repeated = Counter(fingerprint(query["sql"]) for query in queries)
+        repeated = [(sql, count) for sql, count in repeated.most_common() if count > 1]
+        if repeated:
+            self.stdout.write("\nПовторы:")
+            for sql, count in repeated[: self.top]:
+                self.stdout.write(f"{count:6d} раз  {sql}")
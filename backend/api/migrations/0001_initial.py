@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:24
+
+from collections import Counter
+
+from django.db import migrations, models
+
+# (модель, поле файла, поле вариантов)
+FILE_FIELDS = (
+    ("recipes.Recipe", "image", "image_variants"),
+    ("users.User", "avatar", "avatar_variants"),
+)
+
+
+def count_references(apps, schema_editor):
+    counts = Counter()
+    for model_name, field, variants_field in FILE_FIELDS:
+        model = apps.get_model(model_name)
+        for file_name, variants in model.objects.values_list(field, variants_field):
+            if file_name:
+                counts[file_name] += 1
+            for paths in (variants or {}).get("sizes", {}).values():
+                counts.update(paths.values())
+    stored_file = apps.get_model("api", "StoredFile")
+    stored_file.objects.bulk_create(
+        [stored_file(name=name, references=count) for name, count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("recipes", "0009_recipe_image_variants"),
+        ("users", "0007_user_avatar_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredFile",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=255,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Путь",
+                    ),
+                ),
+                (
+                    "references",
+                    models.PositiveIntegerField(default=0, verbose_name="Ссылки"),
+                ),
+            ],
+            options={
+                "verbose_name": "Файл",
+                "verbose_name_plural": "Файлы",
+                "indexes": [
+                    models.Index(
+                        fields=["references"], name="storedfile_references_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
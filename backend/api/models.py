@@ -0,0 +1,16 @@
+from django.db import models
+
+
+# Файл в хранилище с адресацией по содержимому и число ссылок на него
+# из полей моделей. Файлы без ссылок удаляет команда collect_media_garbage.
+class StoredFile(models.Model):
+    name = models.CharField(max_length=255, primary_key=True, verbose_name="Путь")
+    references = models.PositiveIntegerField(default=0, verbose_name="Ссылки")
+
+    class Meta:
+        indexes = [models.Index(fields=["references"], name="storedfile_references_idx")]
+        verbose_name = "Файл"
+        verbose_name_plural = "Файлы"
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
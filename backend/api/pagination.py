@@ -0,0 +1,180 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes import timelines
+
+
+# Постраничный вывод по ключу из полей, отсортированных по убыванию.
+# Позиция передаётся в параметре cursor, поэтому глубина страницы не влияет
+# на время запроса, а общее количество не считается.
+class KeysetPagination(BasePagination):
+    cursor_query_param = "cursor"
+    page_size_query_param = "limit"
+    max_page_size = 100
+    invalid_cursor_message = "Некорректный курсор."
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, None
+        try:
+            reverse, values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.fields):
+                raise ValueError
+            values = [
+                self.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), values
+
+    def encode_cursor(self, reverse, obj):
+        values = [getattr(obj, field) for field in self.fields]
+        raw = json.dumps([int(reverse), values], default=str)
+        encoded = base64.urlsafe_b64encode(raw.encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
+
+    def position_filter(self, values, lookup):
+        # (a, b) < (va, vb)  =>  a < va OR (a = va AND b < vb)
+        conditions = []
+        for index, field in enumerate(self.fields):
+            equal = {name: value for name, value in zip(self.fields[:index], values)}
+            conditions.append(Q(**equal, **{f"{field}__{lookup}": values[index]}))
+        return reduce(or_, conditions)
+
+    # Объекты за позицией values, при reverse — перед ней, начиная с ближайшего
+    def fetch(self, queryset, values, reverse, size):
+        if values is None:
+            queryset = queryset.order_by(*(f"-{field}" for field in self.fields))
+        elif reverse:
+            queryset = queryset.filter(self.position_filter(values, "gt")).order_by(
+                *self.fields
+            )
+        else:
+            queryset = queryset.filter(self.position_filter(values, "lt")).order_by(
+                *(f"-{field}" for field in self.fields)
+            )
+        return list(queryset[:size])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        page_size = self.get_page_size(request)
+        reverse, values = self.decode_cursor(request)
+
+        page = self.fetch(queryset, values, reverse, page_size + 1)
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if reverse:
+            page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = page
+        return page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(False, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(True, self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+
+# Лента подписок: позиции страницы берутся из ленты пользователя
+# (recipes.timelines), рецепты загружаются по id из переданного queryset
+class TimelinePagination(KeysetPagination):
+    def __init__(self):
+        super().__init__(("created", "id"))
+
+    def fetch(self, queryset, values, reverse, size):
+        ids = timelines.read(self.request.user, size, values, reverse)
+        recipes = queryset.in_bulk(ids)
+        return [recipes[pk] for pk in ids if pk in recipes]
+
+
+# LimitOffset по умолчанию; ключевой режим включается параметром cursor
+# или pagination=cursor у представлений, где задан cursor_ordering.
+# Курсор описывает позицию только в порядке cursor_ordering по убыванию,
+# поэтому с другой сортировкой (ordering, релевантность поиска) ключевой
+# режим не применяется: запрос отклоняется, а не сортируется молча иначе.
+class FeedPagination(LimitOffsetPagination):
+    mixed_ordering_message = (
+        "Курсорная пагинация работает только с сортировкой по умолчанию, "
+        "без ordering и search."
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        fields = getattr(view, "cursor_ordering", None)
+        self.keyset = None
+        if fields and (
+            KeysetPagination.cursor_query_param in request.query_params
+            or request.query_params.get("pagination") == "cursor"
+        ):
+            ordering = tuple(queryset.query.order_by)
+            if ordering and ordering != tuple(f"-{field}" for field in fields):
+                raise serializers.ValidationError(
+                    {KeysetPagination.cursor_query_param: self.mixed_ordering_message}
+                )
+            self.keyset = KeysetPagination(fields)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+# Страница списка, который ранжирует не база, а индекс в памяти
+# (recipes.cookable): fetch(offset, limit) возвращает общее число
+# и объекты страницы, поэтому список целиком не строится
+class RankedPagination(LimitOffsetPagination):
+    max_limit = 100
+
+    def paginate_ranked(self, fetch, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        self.count, page = fetch(self.offset, self.limit)
+        return page
@@ -0,0 +1,186 @@
+import codecs
+import re
+import secrets
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.settings import api_settings
+from rest_framework.utils import json
+
+from .images import Base64Spool
+
+CHUNK_SIZE = 64 * 1024
+# Сколько символов строки нужно, чтобы узнать в ней заголовок data URI
+HEADER_SIZE = 128
+DATA_URI = re.compile(r"data:image\\?/([\w.+-]+);base64,")
+SPECIAL = re.compile(r'["\\]')
+OUTSIDE, START, STRING, BASE64 = range(4)
+# Ключи, значения которых выгружаются во временные файлы; остальные
+# строки, даже похожие на data URI, разбираются как обычный текст
+IMAGE_KEYS = ("image", "avatar")
+KEY_SIZE = max(map(len, IMAGE_KEYS))
+
+
+# Проходит по тексту JSON и выгружает значения image и avatar вида
+# data:image/...;base64, во временные файлы, оставляя на их месте метки.
+# Остальной текст копируется как есть и разбирается обычным json.loads.
+class _Scanner:
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+        self.uploads = []
+        self.marker = f"\0{secrets.token_hex(8)}:"
+        self.state = OUTSIDE
+        self.pending = ""
+        # Начало текущей строки, последняя строка и то, что было после неё
+        # (пробелы не считаются): строка — значение ключа, если между ними «:»
+        self.current = ""
+        self.previous = None
+        self.gap = ""
+        self.key = None
+
+    def emit(self, text):
+        self.length += len(text)
+        limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        if limit is not None and self.length > limit:
+            raise ParseError("Слишком большой запрос.")
+        self.parts.append(text)
+
+    def feed(self, text, final=False):
+        text, self.pending = self.pending + text, ""
+        position, length = 0, len(text)
+        while position < length or self.state == START and final:
+            if self.state == OUTSIDE:
+                end = text.find('"', position)
+                segment = text[position:] if end == -1 else text[position:end]
+                self.gap = (self.gap + "".join(segment.split()))[:2]
+                if end == -1:
+                    self.emit(segment)
+                    return
+                self.emit(text[position:end + 1])
+                position = end + 1
+                self.key = self.previous if self.gap == ":" else None
+                self.current, self.previous, self.gap = "", None, ""
+                self.state = START
+            elif self.state == START:
+                if self.key not in IMAGE_KEYS:
+                    self.state = STRING
+                    continue
+                head = text[position:position + HEADER_SIZE]
+                match = DATA_URI.match(head)
+                if match:
+                    self.spool = Base64Spool()
+                    self.subtype = match.group(1)
+                    position += match.end()
+                    self.state = BASE64
+                elif not final and len(head) < HEADER_SIZE and '"' not in head:
+                    # Начало строки попало на границу блока, ждём продолжения
+                    self.pending = head
+                    return
+                else:
+                    self.state = STRING
+            elif self.state == STRING:
+                match = SPECIAL.search(text, position)
+                if match is None:
+                    self.remember(text[position:])
+                    self.emit(text[position:])
+                    return
+                end = match.end()
+                if match.group() == '"':
+                    self.remember(text[position:match.start()])
+                    if len(self.current) <= KEY_SIZE:
+                        self.previous = self.current
+                    self.state = OUTSIDE
+                elif end == length:
+                    self.remember(text[position:match.start()])
+                    self.emit(text[position:match.start()])
+                    self.pending = "\\"
+                    return
+                else:
+                    end += 1
+                    self.remember(text[position:end])
+                self.emit(text[position:end])
+                position = end
+            else:
+                end = text.find('"', position)
+                segment = text[position:] if end == -1 else text[position:end]
+                if end == -1 and segment.endswith("\\"):
+                    segment, self.pending = segment[:-1], "\\"
+                self.write_base64(segment)
+                if end == -1:
+                    return
+                self.finish_upload()
+                position = end + 1
+                self.state = OUTSIDE
+
+    def remember(self, segment):
+        if len(self.current) <= KEY_SIZE:
+            self.current += segment[:KEY_SIZE + 1]
+
+    def write_base64(self, segment):
+        # Кодировщики JSON могут экранировать «/» и переносы строк base64
+        segment = segment.replace("\\/", "/").replace("\\n", "").replace("\\r", "")
+        try:
+            self.spool.write(segment)
+        except ValueError as error:
+            raise ParseError(f"Ошибка обработки изображения: {error}")
+
+    def finish_upload(self):
+        try:
+            file = self.spool.close()
+        except ValueError as error:
+            raise ParseError(f"Ошибка обработки изображения: {error}")
+        self.uploads.append(
+            UploadedFile(
+                file,
+                name=f"upload.{self.subtype}",
+                content_type=f"image/{self.subtype}",
+                size=self.spool.size,
+            )
+        )
+        self.emit(json.dumps(f"{self.marker}{len(self.uploads) - 1}")[1:])
+
+    def text(self):
+        self.feed("", final=True)
+        self.emit(self.pending)
+        return "".join(self.parts)
+
+    def attach(self, data):
+        if isinstance(data, dict):
+            return {key: self.attach(value) for key, value in data.items()}
+        if isinstance(data, list):
+            return [self.attach(value) for value in data]
+        if isinstance(data, str) and data.startswith(self.marker):
+            return self.uploads[int(data[len(self.marker):])]
+        return data
+
+
+# JSON-парсер, который не держит изображения base64 в памяти целиком:
+# тело читается блоками, строки data:image/...;base64, декодируются
+# по частям во временные файлы и попадают в данные запроса как UploadedFile.
+# Наследник JSONParser получил бы от DRF уже прочитанное request.body,
+# поэтому парсер наследуется от BaseParser.
+class StreamingJSONParser(BaseParser):
+    media_type = "application/json"
+    renderer_class = renderers.JSONRenderer
+    strict = api_settings.STRICT_JSON
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        scanner = _Scanner()
+        try:
+            while chunk := stream.read(CHUNK_SIZE):
+                scanner.feed(decoder.decode(chunk))
+            scanner.feed(decoder.decode(b"", final=True))
+            parse_constant = json.strict_constant if self.strict else None
+            data = json.loads(scanner.text(), parse_constant=parse_constant)
+        except ValueError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+        if not scanner.uploads:
+            return data
+        return scanner.attach(data)
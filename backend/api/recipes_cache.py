@@ -0,0 +1,156 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from foodgram_backend import versioned_cache
+from foodgram_backend.db_routing import primary
+from ingredients.models import Ingredient
+from recipes.models import IngredientRecipe, Recipe, Tag
+from recipes.ranking import scores_changed
+from users.models import User
+
+FEED_VERSION_KEY = "recipes:feed:version"
+RECIPE_VERSION_KEY = "recipes:detail:version:{}"
+# Поля пользователя, которые попадают в выдачу рецептов
+AUTHOR_FIELDS = {"username", "first_name", "last_name", "email", "avatar"}
+
+
+def _request_hash(request):
+    params = sorted(request.GET.lists())
+    raw = f"{request.get_host()}|{request.path}|{params}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def list_key(request):
+    version = versioned_cache.current(FEED_VERSION_KEY)
+    return f"recipes:list:{version}:{_request_hash(request)}"
+
+
+def detail_key(request, pk):
+    version = versioned_cache.current(RECIPE_VERSION_KEY.format(pk))
+    return f"recipes:detail:{pk}:{version}:{_request_hash(request)}"
+
+
+async def alist_key(request):
+    version = await versioned_cache.acurrent(FEED_VERSION_KEY)
+    return f"recipes:list:{version}:{_request_hash(request)}"
+
+
+async def adetail_key(request, pk):
+    version = await versioned_cache.acurrent(RECIPE_VERSION_KEY.format(pk))
+    return f"recipes:detail:{pk}:{version}:{_request_hash(request)}"
+
+
+def _new_entry(data):
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return {
+        "data": data,
+        "etag": quote_etag(hashlib.md5(payload.encode()).hexdigest()),
+        "last_modified": int(time.time()),
+    }
+
+
+def _respond(request, entry, render):
+    response = get_conditional_response(
+        request, etag=entry["etag"], last_modified=entry["last_modified"]
+    )
+    if response is None:
+        response = render(entry["data"])
+    response["ETag"] = entry["etag"]
+    response["Last-Modified"] = http_date(entry["last_modified"])
+    response["Cache-Control"] = "public, no-cache"
+    patch_vary_headers(response, ["Authorization"])
+    return response
+
+
+def cached_response(request, key, build):
+    entry = cache.get(key)
+    if entry is None:
+        with primary():
+            response = build()
+        if response.status_code != 200:
+            return response
+        entry = _new_entry(response.data)
+        cache.set(key, entry, settings.RECIPE_CACHE_TIMEOUT)
+    return _respond(request, entry, Response)
+
+
+# То же для асинхронных представлений: build — корутина, возвращающая данные
+# ответа или None, если ответ должно построить синхронное представление
+async def acached_response(request, key, build, render):
+    entry = await cache.aget(key)
+    if entry is None:
+        with primary():
+            data = await build()
+        if data is None:
+            return None
+        entry = _new_entry(data)
+        await cache.aset(key, entry, settings.RECIPE_CACHE_TIMEOUT)
+    return _respond(request, entry, render)
+
+
+def invalidate(recipe_ids=()):
+    versioned_cache.bump_on_commit(
+        FEED_VERSION_KEY, *(RECIPE_VERSION_KEY.format(pk) for pk in recipe_ids)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    invalidate([instance.pk])
+
+
+# Рейтинги видны только в порядке списков, карточки рецептов не меняются
+@receiver(scores_changed)
+def scores_recomputed(**kwargs):
+    invalidate()
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_changed(instance, **kwargs):
+    invalidate([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, Recipe):
+        invalidate([instance.pk])
+    else:
+        invalidate(list(pk_set or ()))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(instance, **kwargs):
+    invalidate(list(instance.recipe_set.values_list("id", flat=True)))
+
+
+# Удаление ингредиента каскадно удаляет строки IngredientRecipe и сбрасывает их рецепты
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(instance, **kwargs):
+    invalidate(
+        list(
+            IngredientRecipe.objects.filter(ingredient_id=instance.pk).values_list(
+                "recipe_id", flat=True
+            )
+        )
+    )
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields, **kwargs):
+    if created or (update_fields is not None and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    invalidate(list(instance.recipes.values_list("id", flat=True)))
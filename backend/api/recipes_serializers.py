@@ -1,22 +1,23 @@
-import base64
-import uuid
-from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
 from rest_framework import serializers
+from .images import ImageVariantsField, decode_image, schedule_variants
 from .users_serializers import CustomUserSerializer
+from .viewer_state import get_viewer_state
+from recipes import shopping_list
+from recipes.catalog import tag_catalog
 from recipes.models import Recipe, Tag, IngredientRecipe, Favorite, ShoppingCart
 from ingredients.models import Ingredient
 
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith("data:image"):
-            try:
-                format, imgstr = data.split(";base64,")
-                ext = format.split("/")[-1]
-                id = uuid.uuid4().hex
-                data = ContentFile(base64.b64decode(imgstr), name=f"{id}.{ext}")
-            except Exception as e:
-                raise serializers.ValidationError(f"Ошибка обработки изображения: {e}")
+        # Файл уже проверен Pillow в пуле декодирования, повторно не открываем.
+        # Загруженные файлы тоже проверяем там: ImageField читает их в память целиком.
+        if isinstance(data, UploadedFile) or (
+            isinstance(data, str) and data.startswith("data:image")
+        ):
+            return decode_image(data)
         return super().to_internal_value(data)
 
 
@@ -26,13 +27,35 @@ class TagSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+# На запись — список id тегов, на чтение — теги из справочника
+# по id, подгруженным вместе с рецептом. Версия справочника проверяется
+# один раз за сериализацию: словарь тегов кладётся в контекст.
+class TagListField(serializers.ListField):
+    child = serializers.IntegerField()
+
+    def to_internal_value(self, data):
+        tag_ids = list(dict.fromkeys(super().to_internal_value(data)))
+        missing = set(tag_ids) - set(tag_catalog.ids())
+        if missing:
+            raise serializers.ValidationError(
+                f"Теги с id {', '.join(map(str, sorted(missing)))} не найдены."
+            )
+        return tag_ids
+
+    def to_representation(self, value):
+        by_id = self.context.get("tags_by_id")
+        if by_id is None:
+            by_id = self.context["tags_by_id"] = tag_catalog.by_id()
+        tags = (by_id.get(tag.id) for tag in value.all())
+        return sorted((tag for tag in tags if tag), key=lambda tag: tag["name"])
+
+
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     AMOUNT_MIN = 1
     AMOUNT_MAX = 32000
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(), source="ingredient.id"
-    )
+    # Существование ингредиентов проверяется одним запросом в RecipeSerializer
+    id = serializers.IntegerField(source="ingredient.id")
     name = serializers.ReadOnlyField(source="ingredient.name")
     measurement_unit = serializers.ReadOnlyField(source="ingredient.measurement_unit")
     amount = serializers.IntegerField(min_value=AMOUNT_MIN, max_value=AMOUNT_MAX)
@@ -47,8 +70,10 @@ class RecipeSerializer(serializers.ModelSerializer):
     COOKING_TIME_MAX = 32000
 
     image = Base64ImageField(required=True)
+    image_variants = ImageVariantsField("recipe")
     ingredients = IngredientInRecipeSerializer(source="ingredient_recipes", many=True)
     author = CustomUserSerializer(read_only=True)
+    tags = TagListField(required=False)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     cooking_time = serializers.IntegerField(
@@ -59,12 +84,14 @@ class RecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = [
             "id",
+            "tags",
             "author",
             "ingredients",
             "is_favorited",
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_variants",
             "text",
             "cooking_time",
         ]
@@ -95,31 +122,79 @@ class RecipeSerializer(serializers.ModelSerializer):
                     {"ingredients": "Поле ingredients не может быть пустым."}
                 )
 
+        if "ingredient_recipes" in data:
+            ids = [item["ingredient"]["id"] for item in data["ingredient_recipes"]]
+            missing = set(ids) - set(
+                Ingredient.objects.filter(id__in=ids).values_list("id", flat=True)
+            )
+            if missing:
+                raise serializers.ValidationError(
+                    {
+                        "ingredients": "Ингредиенты не найдены: "
+                        + ", ".join(map(str, sorted(missing)))
+                    }
+                )
+
         return data
 
-    def _create_ingredients(self, recipe, ingredients_data):
-        recipe.ingredient_recipes.all().delete()
-        for ingredient_data in ingredients_data:
-            IngredientRecipe.objects.create(
-                recipe=recipe,
-                ingredient=ingredient_data["ingredient"]["id"],
-                amount=ingredient_data["amount"],
-            )
+    def _create_ingredients(self, recipe, ingredients_data, created=False):
+        amounts = {
+            item["ingredient"]["id"]: item["amount"] for item in ingredients_data
+        }
+        existing = (
+            {}
+            if created
+            else {
+                item.ingredient_id: item
+                for item in IngredientRecipe.objects.filter(recipe=recipe)
+            }
+        )
+        old_amounts = {key: item.amount for key, item in existing.items()}
+
+        to_update = []
+        for ingredient_id, item in existing.items():
+            if ingredient_id in amounts and item.amount != amounts[ingredient_id]:
+                item.amount = amounts[ingredient_id]
+                to_update.append(item)
+        removed = [
+            item.pk for key, item in existing.items() if key not in amounts
+        ]
 
+        if removed:
+            IngredientRecipe.objects.filter(pk__in=removed).delete()
+        IngredientRecipe.objects.bulk_update(to_update, ["amount"])
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient_id=key, amount=amount)
+            for key, amount in amounts.items()
+            if key not in existing
+        )
+        if not created:
+            # Удалённые строки состава списки покупок учитывают по сигналу
+            kept = {key: old_amounts[key] for key in old_amounts if key in amounts}
+            shopping_list.change_recipe(recipe, kept, amounts)
+
+    def _reload(self, recipe):
+        # Перечитываем рецепт тем же запросом, что и список, чтобы ответ
+        # не подгружал ингредиенты по одному
+        return Recipe.objects.with_related().get(pk=recipe.pk)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop("ingredient_recipes", [])
-        tags_data = self.initial_data.get("tags", [])
+        tags_data = validated_data.pop("tags", [])
 
         recipe = Recipe.objects.create(**validated_data)
 
         recipe.tags.set(tags_data)
-        self._create_ingredients(recipe, ingredients_data)
+        self._create_ingredients(recipe, ingredients_data, created=True)
+        schedule_variants("recipe", recipe.pk)
 
-        return recipe
+        return self._reload(recipe)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop("ingredient_recipes", None)
-        tags_data = self.initial_data.get("tags", None)
+        tags_data = validated_data.pop("tags", None)
 
         instance.name = validated_data.get("name", instance.name)
         instance.text = validated_data.get("text", instance.text)
@@ -129,8 +204,10 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         if "image" in validated_data:
             instance.image = validated_data.get("image", instance.image)
+            schedule_variants("recipe", instance.pk)
 
-        instance.save()
+        # Варианты изображения пишет фоновая задача, их не перезаписываем
+        instance.save(update_fields=["name", "text", "cooking_time", "image"])
 
         if tags_data is not None:
             instance.tags.set(tags_data)
@@ -138,22 +215,18 @@ class RecipeSerializer(serializers.ModelSerializer):
         if ingredients_data is not None:
             self._create_ingredients(instance, ingredients_data)
 
-        return instance
+        return self._reload(instance)
 
     def get_is_favorited(self, obj):
-        user = self.context["request"].user
-        if user.is_anonymous:
-            return False
-        return obj.in_favorites.filter(user=user).exists()
+        return obj.pk in get_viewer_state(self.context.get("request")).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context["request"].user
-        if user.is_anonymous:
-            return False
-        return obj.in_shopping_cart.filter(user=user).exists()
+        return obj.pk in get_viewer_state(self.context.get("request")).cart
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField("recipe")
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_variants", "cooking_time")
@@ -1,59 +1,126 @@
-from rest_framework import viewsets, permissions, filters, status
+from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.permissions import (
     IsAuthenticated,
     AllowAny,
     IsAuthenticatedOrReadOnly,
 )
+from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
+from . import recipes_cache
+from .filters import RecipeSearchFilter, StableOrderingFilter
+from .images import get_broker
+from .pagination import FeedPagination, RankedPagination, TimelinePagination
 from .permissions import IsAuthorOrReadOnly
-from collections import defaultdict
-from django.http import HttpResponse
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Sum, F
-from recipes.models import Recipe, Favorite, ShoppingCart, IngredientRecipe
+from django.db import transaction
+from django.db.models import F
+from recipes import timelines
+from recipes.catalog import tag_catalog
+from recipes.cookable import cookable_index
+from recipes.models import Recipe, Favorite, ShoppingCart
 from .recipes_serializers import RecipeSerializer, ShortRecipeSerializer
+from .shopping_cart_export import EXPORT_FORMATS, pdf_available
+
+
+# Фильтры списка рецептов; общие для RecipeViewSet и асинхронного списка
+def filter_recipes(queryset, params, user):
+    is_in_shopping_cart = params.get("is_in_shopping_cart")
+    is_favorited = params.get("is_favorited")
+    author_id = params.get("author")
+
+    if author_id:
+        queryset = queryset.filter(author__id=author_id)
+
+    # Несколько тегов объединяются по ИЛИ одним подзапросом, без distinct
+    tags = params.getlist("tags")
+    if tags:
+        queryset = queryset.with_tags(tag_catalog.ids_for_slugs(tags))
+
+    # Для анонимного пользователя флаги всегда False, фильтры игнорируем
+    if user.is_authenticated:
+        if is_in_shopping_cart in ["true", "True", "1"]:
+            queryset = queryset.in_cart_of(user)
+        elif is_in_shopping_cart in ["false", "False", "0"]:
+            queryset = queryset.in_cart_of(user, False)
+
+        if is_favorited in ["true", "True", "1"]:
+            queryset = queryset.favorited_by(user)
+        elif is_favorited in ["false", "False", "0"]:
+            queryset = queryset.favorited_by(user, False)
+
+    return queryset
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = [IsAuthenticatedOrReadOnly & IsAuthorOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [StableOrderingFilter, RecipeSearchFilter]
     search_fields = ["name", "author__username"]
-    ordering_fields = ["created"]
+    ordering_fields = ["created", "popularity", "trending"]
     ordering = ["-created"]
+    pagination_class = FeedPagination
+    cursor_ordering = ("created", "id")
 
     def get_queryset(self):
-        queryset = Recipe.objects.all()
-        user = self.request.user
-        is_in_shopping_cart = self.request.query_params.get("is_in_shopping_cart")
-        is_favorited = self.request.query_params.get("is_favorited")
-        author_id = self.request.query_params.get("author")
-
-        if author_id:
-            queryset = queryset.filter(author__id=author_id)
-
-        if user.is_authenticated:
-            if is_in_shopping_cart in ["true", "True", "1"]:
-                queryset = queryset.filter(in_shopping_cart__user=user)
-            elif is_in_shopping_cart in ["false", "False", "0"]:
-                queryset = queryset.exclude(in_shopping_cart__user=user)
-
-            if is_favorited in ["true", "True", "1"]:
-                queryset = queryset.filter(in_favorites__user=user)
-            elif is_favorited in ["false", "False", "0"]:
-                queryset = queryset.exclude(in_favorites__user=user)
-        else:
-            # Если пользователь неавторизован, игнорируем фильтры
-            if is_in_shopping_cart or is_favorited:
-                # Просто возвращаем все рецепты без фильтрации
-                queryset = queryset
-
-        return queryset.distinct()
+        return filter_recipes(
+            Recipe.objects.with_related(), self.request.query_params, self.request.user
+        )
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        return recipes_cache.cached_response(
+            request,
+            recipes_cache.list_key(request),
+            lambda: super(RecipeViewSet, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        return recipes_cache.cached_response(
+            request,
+            recipes_cache.detail_key(request, kwargs["pk"]),
+            lambda: super(RecipeViewSet, self).retrieve(request, *args, **kwargs),
+        )
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            recipe = serializer.save(author=self.request.user)
+            transaction.on_commit(
+                lambda: get_broker().enqueue(timelines.publish, recipe.pk)
+            )
+
+    # Рецепты по рейтингу в тренде (recipes.ranking), без фильтров
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    def trending(self, request):
+        def build():
+            queryset = (
+                Recipe.objects.with_related()
+                .filter(trending__gt=0)
+                .order_by("-trending", "-id")
+            )
+            paginator = LimitOffsetPagination()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        if request.user.is_authenticated:
+            return build()
+        return recipes_cache.cached_response(
+            request, recipes_cache.list_key(request), build
+        )
+
+    # Рецепты авторов из подписок, новые сверху; только курсорная пагинация
+    @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        paginator = TimelinePagination()
+        page = paginator.paginate_queryset(Recipe.objects.with_related(), request, self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
@@ -72,14 +139,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     {"error": "Рецепт уже в корзине"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            ShoppingCart.objects.create(user=request.user, recipe=recipe)
+            with transaction.atomic():
+                ShoppingCart.objects.create(user=request.user, recipe=recipe)
             serializer = ShortRecipeSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         elif request.method == "DELETE":
             cart_item = recipe.in_shopping_cart.filter(user=request.user)
             if cart_item.exists():
-                cart_item.delete()
+                with transaction.atomic():
+                    cart_item.delete()
                 return Response(
                     {"success": "Рецепт удалён"}, status=status.HTTP_204_NO_CONTENT
                 )
@@ -90,35 +159,40 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
-        shopping_cart_items = ShoppingCart.objects.filter(user=request.user)
-
-        ingredient_summary = defaultdict(lambda: {"amount": 0, "measurement_unit": ""})
+        file_format = request.query_params.get("file_format", "txt")
+        if file_format not in EXPORT_FORMATS or (
+            file_format == "pdf" and not pdf_available()
+        ):
+            return Response(
+                {"error": f"Неподдерживаемый формат: {file_format}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        content_type, extension, export = EXPORT_FORMATS[file_format]
 
         ingredient_summary = (
-            IngredientRecipe.objects.filter(
-                recipe__in=shopping_cart_items.values("recipe")
+            request.user.shopping_list.values(
+                "ingredient__name",
+                "ingredient__measurement_unit",
+                total_amount=F("amount"),
             )
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(total_amount=Sum("amount"))
             .order_by("ingredient__name")
+            .iterator()
         )
 
-        content = "Список покупок:\n\n"
-        for item in ingredient_summary:
-            content += (
-                f"- {item['ingredient__name']}: "
-                f"{item['total_amount']} "
-                f"{item['ingredient__measurement_unit']}\n"
-            )
-
-        response = HttpResponse(content, content_type="text/plain")
-        response["Content-Disposition"] = 'attachment; filename="shopping_cart.txt"'
+        response = StreamingHttpResponse(
+            export(ingredient_summary), content_type=content_type
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_cart.{extension}"'
+        )
         return response
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def view_shopping_cart(self, request):
-        items = request.user.shopping_cart.all().order_by("id")
-        serializer = ShortRecipeSerializer(items, many=True)
+        recipes = Recipe.objects.filter(
+            in_shopping_cart__user=request.user
+        ).order_by("in_shopping_cart__id")
+        serializer = ShortRecipeSerializer(recipes, many=True)
         return Response(serializer.data)
 
     @action(
@@ -133,7 +207,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     {"error": "Рецепт уже в избранном"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            Favorite.objects.create(user=request.user, recipe=recipe)
+            with transaction.atomic():
+                Favorite.objects.create(user=request.user, recipe=recipe)
             serializer = ShortRecipeSerializer(recipe)
             return Response(
                 serializer.data,
@@ -143,7 +218,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if request.method == "DELETE":
             favorite_item = recipe.in_favorites.filter(user=request.user)
             if favorite_item.exists():
-                favorite_item.delete()
+                with transaction.atomic():
+                    favorite_item.delete()
                 return Response(
                     {"success": "Рецепт удалён из избранного"},
                     status=status.HTTP_204_NO_CONTENT,
@@ -153,10 +229,56 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    def cookable(self, request):
+        # Рецепты из имеющихся ингредиентов: ?ingredients=1,2,3 и
+        # необязательный max_missing — сколько ингредиентов может не хватать
+        try:
+            ingredient_ids = {
+                int(value)
+                for param in request.query_params.getlist("ingredients")
+                for value in param.split(",")
+                if value.strip()
+            }
+            max_missing = request.query_params.get("max_missing")
+            max_missing = None if max_missing is None else int(max_missing)
+        except ValueError:
+            return Response(
+                {"error": "Параметры ingredients и max_missing должны быть числами"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not ingredient_ids:
+            return Response(
+                {"error": "Укажите ингредиенты в параметре ingredients"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        paginator = RankedPagination()
+        page = paginator.paginate_ranked(
+            lambda offset, limit: cookable_index.rank(
+                ingredient_ids, max_missing, offset, limit
+            ),
+            request,
+        )
+        recipes = Recipe.objects.with_related().in_bulk(
+            [recipe_id for recipe_id, _ in page]
+        )
+        page = [
+            (recipes[recipe_id], missing)
+            for recipe_id, missing in page
+            if recipe_id in recipes
+        ]
+        data = self.get_serializer([recipe for recipe, _ in page], many=True).data
+        for item, (_, missing) in zip(data, page):
+            item["missing_ingredients"] = missing
+        return paginator.get_paginated_response(data)
+
     @action(
         detail=True, methods=["get"], url_path="get-link", permission_classes=[AllowAny]
     )
     def get_link(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        short_link = f"https://foodgram.com/r/{recipe.pk}"
-        return Response({"short-link": short_link})
+        # Читается только код, сам рецепт не загружается
+        code = Recipe.objects.filter(pk=pk).values_list("short_code", flat=True).first()
+        if code is None:
+            raise Http404
+        return Response({"short-link": request.build_absolute_uri(f"/s/{code}")})
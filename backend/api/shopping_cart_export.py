@@ -0,0 +1,135 @@
+import csv
+import json
+import logging
+import tempfile
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+PDF_FONT_NAME = "ShoppingListFont"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _buffered(parts):
+    # Склеиваем мелкие строки, чтобы не отдавать по одной строке на запись в сокет
+    buffer = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _txt(rows):
+    yield "Список покупок:\n\n"
+    for item in rows:
+        yield (
+            f"- {item['ingredient__name']}: "
+            f"{item['total_amount']} "
+            f"{item['ingredient__measurement_unit']}\n"
+        )
+
+
+def _csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(["Ингредиент", "Количество", "Единица измерения"])
+    for item in rows:
+        yield writer.writerow(
+            [
+                item["ingredient__name"],
+                item["total_amount"],
+                item["ingredient__measurement_unit"],
+            ]
+        )
+
+
+def _json(rows):
+    yield "["
+    separator = ""
+    for item in rows:
+        yield separator + json.dumps(
+            {
+                "name": item["ingredient__name"],
+                "amount": item["total_amount"],
+                "measurement_unit": item["ingredient__measurement_unit"],
+            },
+            ensure_ascii=False,
+        )
+        separator = ","
+    yield "]"
+
+
+def _pdf(rows):
+    # PDF нельзя отдавать построчно из-за таблицы ссылок в конце файла,
+    # поэтому документ собирается во временный файл и отдаётся частями
+    # Шрифт регистрирует pdf_available до начала ответа
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    width, height = A4
+    margin = 50
+    line_height = 18
+    with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 16) as output:
+        pdf = canvas.Canvas(output, pagesize=A4)
+        pdf.setFont(PDF_FONT_NAME, 16)
+        pdf.drawString(margin, height - margin, "Список покупок")
+        pdf.setFont(PDF_FONT_NAME, 12)
+        y = height - margin - line_height * 2
+        for item in rows:
+            if y < margin:
+                pdf.showPage()
+                pdf.setFont(PDF_FONT_NAME, 12)
+                y = height - margin
+            pdf.drawString(
+                margin,
+                y,
+                f"• {item['ingredient__name']}: {item['total_amount']} "
+                f"{item['ingredient__measurement_unit']}",
+            )
+            y -= line_height
+        pdf.save()
+        output.seek(0)
+        while chunk := output.read(CHUNK_SIZE):
+            yield chunk
+
+
+EXPORT_FORMATS = {
+    "txt": ("text/plain; charset=utf-8", "txt", lambda rows: _buffered(_txt(rows))),
+    "csv": ("text/csv; charset=utf-8", "csv", lambda rows: _buffered(_csv(rows))),
+    "json": (
+        "application/json; charset=utf-8",
+        "json",
+        lambda rows: _buffered(_json(rows)),
+    ),
+    "pdf": ("application/pdf", "pdf", _pdf),
+}
+
+
+# Шрифт загружается здесь, а не при выдаче: ошибка после отправленных
+# заголовков 200 оборвала бы файл, а так клиент сразу получает 400
+def pdf_available():
+    try:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFError, TTFont
+    except ImportError:
+        return False
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return True
+    try:
+        font = TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+    except (OSError, TTFError):
+        logger.exception("Не удалось загрузить шрифт списка покупок")
+        return False
+    pdfmetrics.registerFont(font)
+    return True
@@ -0,0 +1,13 @@
+from django.http import Http404, HttpResponseRedirect
+
+from recipes.short_links import click_counter, resolve
+
+
+# Переход по короткой ссылке на страницу рецепта во фронтенде.
+# Рецепт не загружается: id берётся из кеша кодов.
+def short_link_redirect(request, code):
+    recipe_id = resolve(code)
+    if recipe_id is None:
+        raise Http404("Ссылка не найдена.")
+    click_counter.add(recipe_id)
+    return HttpResponseRedirect(f"/recipes/{recipe_id}")
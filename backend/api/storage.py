@@ -0,0 +1,33 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+# Файлы называются по SHA-256 содержимого: повторная загрузка того же
+# изображения не пишет новый файл, а возвращает имя существующего.
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), hexdigest[:2], f"{hexdigest}{extension}"
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Свежее время изменения не даёт сборщику мусора удалить файл,
+            # на который вот-вот появится новая ссылка
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,112 @@
+from collections import Counter
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import StoredFile
+
+# Поля моделей со ссылками на файлы: (модель, поле файла, поле вариантов)
+FILE_FIELDS = {
+    "recipe": ("recipes.Recipe", "image", "image_variants"),
+    "avatar": ("users.User", "avatar", "avatar_variants"),
+}
+OLD_NAMES_ATTR = "_stored_file_names"
+
+
+def variant_names(variants):
+    return {
+        path
+        for paths in (variants or {}).get("sizes", {}).values()
+        for path in paths.values()
+    }
+
+
+def _names(file_name, variants):
+    names = variant_names(variants)
+    if file_name:
+        names.add(file_name)
+    return names
+
+
+def acquire(names):
+    names = set(names)
+    if not names:
+        return
+    StoredFile.objects.bulk_create(
+        [StoredFile(name=name) for name in names], ignore_conflicts=True
+    )
+    StoredFile.objects.filter(name__in=names).update(references=F("references") + 1)
+
+
+def release(names):
+    names = set(names)
+    if names:
+        StoredFile.objects.filter(name__in=names, references__gt=0).update(
+            references=F("references") - 1
+        )
+
+
+# Пересчитывает ссылки по данным моделей. Нужен после массовых операций
+# в обход сигналов (bulk_create, update) и перед удалением файлов,
+# о которых база не знает.
+def recount():
+    counts = Counter()
+    for model_label, field, variants_field in FILE_FIELDS.values():
+        model = apps.get_model(model_label)
+        rows = model.objects.values_list(field, variants_field).iterator()
+        for file_name, variants in rows:
+            counts.update(_names(file_name, variants))
+    with transaction.atomic():
+        StoredFile.objects.update(references=0)
+        files = [StoredFile(name=name, references=count) for name, count in counts.items()]
+        StoredFile.objects.bulk_create(files, batch_size=1000, ignore_conflicts=True)
+        StoredFile.objects.bulk_update(files, ["references"], batch_size=1000)
+    return counts
+
+
+# Изменения файловых полей отслеживаются сигналами: до сохранения читаем
+# прежние значения из базы, после сохранения учитываем разницу. Поле,
+# которого нет в update_fields (варианты при полном сохранении, см.
+# CounterFieldsMixin), в базе не меняется, и для него берётся прежнее значение.
+def _track(model, field, variants_field):
+    tracked = {field, variants_field}
+
+    def before_save(instance, update_fields, **kwargs):
+        if update_fields is not None and not tracked & set(update_fields):
+            return
+        old = (None, None)
+        if not instance._state.adding:
+            row = model.objects.filter(pk=instance.pk).values_list(
+                field, variants_field
+            )
+            old = row[0] if row else old
+        setattr(instance, OLD_NAMES_ATTR, old)
+
+    def after_save(instance, update_fields, **kwargs):
+        old = instance.__dict__.pop(OLD_NAMES_ATTR, None)
+        if old is None:
+            return
+        old_name, old_variants = old
+        new_name, new_variants = old
+        if update_fields is None or field in update_fields:
+            new_name = getattr(instance, field).name
+        if update_fields is None or variants_field in update_fields:
+            new_variants = getattr(instance, variants_field)
+        old, new = _names(old_name, old_variants), _names(new_name, new_variants)
+        acquire(new - old)
+        release(old - new)
+
+    def after_delete(instance, **kwargs):
+        loaded = instance.__dict__
+        if field in loaded and variants_field in loaded:
+            release(_names(getattr(instance, field).name, loaded[variants_field]))
+
+    pre_save.connect(before_save, sender=model, weak=False)
+    post_save.connect(after_save, sender=model, weak=False)
+    post_delete.connect(after_delete, sender=model, weak=False)
+
+
+for model_label, field, variants_field in FILE_FIELDS.values():
+    _track(apps.get_model(model_label), field, variants_field)
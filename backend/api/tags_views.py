@@ -0,0 +1,25 @@
+from django.http import Http404
+from rest_framework import viewsets
+from rest_framework.response import Response
+from recipes.catalog import tag_catalog
+from recipes.models import Tag
+from .recipes_serializers import TagSerializer
+
+
+class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Tag.objects.all()
+    serializer_class = TagSerializer
+    pagination_class = None
+
+    # Теги отдаются из справочника в памяти, без запросов к БД
+    def list(self, request, *args, **kwargs):
+        return Response(tag_catalog.all())
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            tag = tag_catalog.get(int(kwargs["pk"]))
+        except ValueError:
+            tag = None
+        if tag is None:
+            raise Http404
+        return Response(tag)
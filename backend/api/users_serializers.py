@@ -1,6 +1,16 @@
 from rest_framework import serializers
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from users.models import User, Subscription
+from .images import ImageVariantsField
+from .viewer_state import get_viewer_state
+
+
+def get_recipes_limit(request):
+    try:
+        recipes_limit = int(request.query_params["recipes_limit"])
+    except (AttributeError, KeyError, ValueError):
+        return None
+    return max(recipes_limit, 0)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -12,6 +22,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.ImageField(required=False, allow_null=True)
+    avatar_variants = ImageVariantsField("avatar")
 
     class Meta(UserSerializer.Meta):
         model = User
@@ -22,16 +33,12 @@ class CustomUserSerializer(UserSerializer):
             "first_name",
             "last_name",
             "avatar",
+            "avatar_variants",
             "is_subscribed",
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get("request", None)
-        if request is None or not hasattr(request, "user") or request.user.is_anonymous:
-            return False
-        if request.user.id == obj.id:
-            return False
-        return obj.subscribers_set.filter(user=request.user).exists()
+        return obj.id in get_viewer_state(self.context.get("request")).following
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -41,9 +48,10 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     last_name = serializers.CharField(source="author.last_name")
     email = serializers.EmailField(source="author.email")
     avatar = serializers.ImageField(source="author.avatar")
+    avatar_variants = ImageVariantsField("avatar", source="author")
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(source="author.recipes_count")
 
     class Meta:
         model = Subscription
@@ -54,6 +62,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             "last_name",
             "email",
             "avatar",
+            "avatar_variants",
             "is_subscribed",
             "recipes",
             "recipes_count",
@@ -63,17 +72,16 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         from .recipes_serializers import ShortRecipeSerializer
 
         request = self.context.get("request")
-        recipes_limit = request.query_params.get("recipes_limit")
-        recipes_qs = obj.author.recipes.all()
-        if recipes_limit:
-            recipes_qs = recipes_qs[: int(recipes_limit)]
+        recipes = getattr(obj.author, "recent_recipes", None)
+        if recipes is None:
+            recipes = obj.author.recipes.all()
+            recipes_limit = get_recipes_limit(request)
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return ShortRecipeSerializer(
-            recipes_qs, many=True, context={"request": request}
+            recipes, many=True, context={"request": request}
         ).data
 
-    def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
-
     def get_is_subscribed(self, obj):
         return True
 
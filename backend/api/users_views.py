@@ -1,19 +1,24 @@
-import base64
-import uuid
-from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status, mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import filters
 from djoser.views import UserViewSet as DjoserUserViewSet
+from recipes import timelines
+from recipes.models import Recipe
 from users.models import User, Subscription
 from .users_serializers import (
     CustomUserSerializer,
     SubscriptionSerializer,
     SubscriptionCreateSerializer,
+    get_recipes_limit,
 )
+from .images import decode_image, discard_variants, schedule_variants
+from .pagination import FeedPagination
 from .recipes_serializers import RecipeSerializer
 
 
@@ -24,6 +29,13 @@ class UserViewSet(DjoserUserViewSet):
     search_fields = ["username", "email"]
     lookup_field = "id"
     lookup_url_kwarg = "id"
+    pagination_class = FeedPagination
+
+    @property
+    def cursor_ordering(self):
+        if self.action == "subscriptions":
+            return ("created_at", "id")
+        return None
 
     @action(
         detail=False,
@@ -50,9 +62,12 @@ class UserViewSet(DjoserUserViewSet):
                 data={"author": author.id}, context={"request": request}
             )
             serializer.is_valid(raise_exception=True)
-            subscription, created = Subscription.objects.get_or_create(
-                user=user, author=author
-            )
+            with transaction.atomic():
+                subscription, created = Subscription.objects.get_or_create(
+                    user=user, author=author
+                )
+                if created:
+                    timelines.follow(user.pk, author)
 
             subscription_serializer = SubscriptionSerializer(
                 subscription, context={"request": request}
@@ -65,7 +80,9 @@ class UserViewSet(DjoserUserViewSet):
         elif request.method == "DELETE":
             subscription = author.subscribers_set.filter(user=user)
             if subscription.exists():
-                subscription.delete()
+                with transaction.atomic():
+                    subscription.delete()
+                    timelines.unfollow(user.pk, author.pk)
                 return Response(
                     {"success": "Подписка удалена"}, status=status.HTTP_204_NO_CONTENT
                 )
@@ -80,7 +97,19 @@ class UserViewSet(DjoserUserViewSet):
         url_path="subscriptions",
     )
     def subscriptions(self, request):
-        queryset = request.user.subscriptions_set.all()
+        # Авторы и последние рецепты (не больше recipes_limit на автора)
+        # загружаются двумя запросами на страницу, число рецептов хранится у автора
+        recipes = Recipe.objects.order_by("-created", "-id")
+        recipes_limit = get_recipes_limit(request)
+        if recipes_limit is not None:
+            recipes = recipes[:recipes_limit]
+        queryset = (
+            request.user.subscriptions_set.select_related("author")
+            .order_by("-created_at", "-id")
+            .prefetch_related(
+                Prefetch("author__recipes", queryset=recipes, to_attr="recent_recipes")
+            )
+        )
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = SubscriptionSerializer(
@@ -109,24 +138,26 @@ class UserViewSet(DjoserUserViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
             try:
-                format, imgstr = image_data.split(";base64,")
-                ext = format.split("/")[-1]
-                data = ContentFile(
-                    base64.b64decode(imgstr), name=f"{uuid.uuid4().hex}.{ext}"
-                )
-                user.avatar.save(data.name, data, save=True)
+                data = decode_image(image_data)
+            except ValidationError as e:
                 return Response(
-                    {"avatar": request.build_absolute_uri(user.avatar.url)},
-                    status=status.HTTP_200_OK,
-                )
-            except Exception as e:
-                return Response(
-                    {"error": f"Ошибка обработки изображения: {str(e)}"},
-                    status=status.HTTP_400_BAD_REQUEST,
+                    {"error": e.detail[0]}, status=status.HTTP_400_BAD_REQUEST
                 )
+            with transaction.atomic():
+                user.avatar.save(data.name, data, save=False)
+                user.save(update_fields=["avatar"])
+                schedule_variants("avatar", user.pk)
+            return Response(
+                {"avatar": request.build_absolute_uri(user.avatar.url)},
+                status=status.HTTP_200_OK,
+            )
 
         elif request.method == "DELETE":
-            user.avatar.delete(save=True)
+            # Файл может быть общим с другими пользователями, его удалит
+            # collect_media_garbage, когда ссылок не останется
+            discard_variants(user, "avatar")
+            user.avatar = None
+            user.save(update_fields=["avatar", "avatar_variants"])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         elif request.method == "GET":
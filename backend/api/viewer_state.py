@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import IntegerField, Value
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram_backend import versioned_cache
+from foodgram_backend.db_routing import primary
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+VERSION_KEY = "viewer:{}:version"
+STATE_KEY = "viewer:{}:state:{}"
+FAVORITES, CART, FOLLOWING = range(3)
+
+
+# Избранное, корзина и подписки пользователя, который делает запрос.
+# Загружаются одним запросом на весь запрос к API, а флаги is_favorited,
+# is_in_shopping_cart и is_subscribed проверяются по множествам id.
+class ViewerState:
+    def __init__(self, favorites=(), cart=(), following=()):
+        self.favorites = frozenset(favorites)
+        self.cart = frozenset(cart)
+        self.following = frozenset(following)
+
+
+EMPTY = ViewerState()
+
+
+def _load(user_id):
+    rows = (
+        Favorite.objects.filter(user_id=user_id)
+        .order_by()
+        .values_list("recipe_id", Value(FAVORITES, output_field=IntegerField()))
+        .union(
+            ShoppingCart.objects.filter(user_id=user_id)
+            .order_by()
+            .values_list("recipe_id", Value(CART, output_field=IntegerField())),
+            Subscription.objects.filter(user_id=user_id)
+            .order_by()
+            .values_list("author_id", Value(FOLLOWING, output_field=IntegerField())),
+            all=True,
+        )
+    )
+    sets = ([], [], [])
+    for object_id, kind in rows:
+        sets[kind].append(object_id)
+    return sets
+
+
+def fetch(user_id):
+    version = versioned_cache.current(VERSION_KEY.format(user_id))
+    key = STATE_KEY.format(user_id, version)
+    sets = cache.get(key)
+    if sets is None:
+        with primary():
+            sets = _load(user_id)
+        # Состояние пишется под версией, прочитанной до загрузки: если её
+        # сменили параллельно, запись просто не будет прочитана
+        cache.set(key, sets, settings.VIEWER_STATE_CACHE_TIMEOUT)
+    return ViewerState(*sets)
+
+
+def get_viewer_state(request):
+    if request is None or request.user.is_anonymous:
+        return EMPTY
+    state = getattr(request, "_viewer_state", None)
+    if state is None:
+        state = fetch(request.user.pk)
+        request._viewer_state = state
+    return state
+
+
+def invalidate(user_id):
+    versioned_cache.bump_on_commit(VERSION_KEY.format(user_id))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def viewer_relation_changed(instance, **kwargs):
+    invalidate(instance.user_id)
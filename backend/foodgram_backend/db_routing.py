@@ -0,0 +1,92 @@
+import hashlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+REPLICA = "replica"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PIN_KEY = "db:primary:{}"
+
+_read_from_replica = ContextVar("read_from_replica", default=False)
+
+
+# Чтение в безопасных запросах идёт с реплики, запись и чтение внутри
+# транзакций — с основной базы
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db != REPLICA
+
+
+# Чтения внутри блока идут с основной базы. Так читаются данные, которые
+# сохраняются в общий кеш или память процесса под текущей версией:
+# с отстающей реплики под новую версию попало бы старое состояние.
+@contextmanager
+def primary():
+    token = _read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+# Клиент определяется по токену или сессии. После записи его чтения
+# DB_REPLICA_PIN_SECONDS секунд идут с основной базы, чтобы он сразу
+# видел свои изменения несмотря на отставание реплики.
+def _pin_key(request):
+    credentials = request.headers.get("Authorization") or request.COOKIES.get(
+        settings.SESSION_COOKIE_NAME
+    )
+    if not credentials:
+        return None
+    return PIN_KEY.format(hashlib.md5(credentials.encode()).hexdigest())
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            key = _pin_key(request)
+            if request.method not in SAFE_METHODS:
+                if key is not None:
+                    await cache.aset(key, True, settings.DB_REPLICA_PIN_SECONDS)
+                return await get_response(request)
+            pinned = key is not None and await cache.aget(key)
+            token = _read_from_replica.set(not pinned)
+            try:
+                return await get_response(request)
+            finally:
+                _read_from_replica.reset(token)
+
+    else:
+
+        def middleware(request):
+            key = _pin_key(request)
+            if request.method not in SAFE_METHODS:
+                if key is not None:
+                    cache.set(key, True, settings.DB_REPLICA_PIN_SECONDS)
+                return get_response(request)
+            pinned = key is not None and cache.get(key)
+            token = _read_from_replica.set(not pinned)
+            try:
+                return get_response(request)
+            finally:
+                _read_from_replica.reset(token)
+
+    return middleware
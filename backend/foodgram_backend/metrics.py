@@ -0,0 +1,385 @@
+import heapq
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.serializers import BaseSerializer
+
+from . import query_hooks
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# Имя: (тип, описание, границы корзин гистограммы)
+METRICS = {
+    "foodgram_requests_total": ("counter", "Обработанные запросы", None),
+    "foodgram_request_duration_seconds": (
+        "histogram",
+        "Время ответа",
+        DURATION_BUCKETS,
+    ),
+    "foodgram_db_queries": ("histogram", "SQL-запросов на запрос", QUERY_BUCKETS),
+    "foodgram_db_query_seconds_total": ("counter", "Время SQL-запросов", None),
+    "foodgram_db_duplicate_queries_total": (
+        "counter",
+        "Повторы одинаковых SQL-запросов (N+1)",
+        None,
+    ),
+    "foodgram_serializer_seconds_total": ("counter", "Время сериализаторов", None),
+    "foodgram_response_bytes_total": ("counter", "Размер ответов", None),
+    "foodgram_slow_requests_total": ("counter", "Медленные запросы", None),
+}
+WORKERS_KEY = "metrics:workers"
+WORKER_KEY = "metrics:worker:{}"
+WORKER_TIMEOUT = 24 * 60 * 60
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+_recorder = ContextVar("metrics_recorder", default=None)
+
+
+# SQL без значений: запросы, которые отличаются только параметрами
+# или длиной списка IN, получают один отпечаток
+def fingerprint(sql):
+    sql = STRING_LITERAL.sub("?", sql.replace("%s", "?"))
+    sql = VALUE_LIST.sub("(?)", NUMBER_LITERAL.sub("?", sql))
+    return " ".join(sql.split())
+
+
+# Замеры одного запроса к API
+class Recorder:
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.fingerprints = Counter()
+        self.slowest = []
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.query_time += duration
+        self.fingerprints[fingerprint(sql)] += 1
+        sample = (duration, sql)
+        if len(self.slowest) < settings.METRICS_SLOW_LOG_QUERIES:
+            heapq.heappush(self.slowest, sample)
+        else:
+            heapq.heappushpop(self.slowest, sample)
+
+    # Отпечатки, повторённые METRICS_DUPLICATE_QUERIES раз и больше
+    def duplicated(self):
+        threshold = settings.METRICS_DUPLICATE_QUERIES
+        return [
+            (sql, count)
+            for sql, count in self.fingerprints.most_common()
+            if count >= threshold
+        ]
+
+    def duplicates(self):
+        return sum(count - 1 for _, count in self.duplicated())
+
+
+# У DRF нет точки расширения вокруг сериализации, поэтому оборачивается
+# свойство data; вложенные сериализаторы не считаются второй раз
+def _instrument_serializers():
+    data = BaseSerializer.data
+    if getattr(data.fget, "instrumented", False):
+        return
+
+    def timed_data(serializer):
+        recorder = _recorder.get()
+        if recorder is None or recorder.serializer_depth:
+            return data.fget(serializer)
+        recorder.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            recorder.serializer_time += time.perf_counter() - started
+            recorder.serializer_depth -= 1
+
+    timed_data.instrumented = True
+    BaseSerializer.data = property(timed_data)
+
+
+def _worker():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# Метрики процесса. Каждый воркер раз в METRICS_PUBLISH_SECONDS кладёт снимок
+# своих значений в кеш, а /metrics складывает снимки всех воркеров: иначе
+# Prometheus видел бы только воркер, которому достался его запрос.
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._published = None
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: list(value) if isinstance(value, list) else value
+                for key, value in self._values.items()
+            }
+
+    def _due(self, force):
+        now = time.monotonic()
+        if (
+            not force
+            and self._published is not None
+            and now - self._published < settings.METRICS_PUBLISH_SECONDS
+        ):
+            return False
+        self._published = now
+        return True
+
+    def publish(self, force=False):
+        if not self._due(force):
+            return
+        worker = _worker()
+        cache.set(WORKER_KEY.format(worker), self.snapshot(), WORKER_TIMEOUT)
+        workers = cache.get(WORKERS_KEY) or set()
+        if worker not in workers:
+            cache.set(WORKERS_KEY, workers | {worker}, None)
+
+    # Для ASGI: синхронные вызовы кеша в цикле событий блокируют его
+    async def apublish(self, force=False):
+        if not self._due(force):
+            return
+        worker = _worker()
+        await cache.aset(WORKER_KEY.format(worker), self.snapshot(), WORKER_TIMEOUT)
+        workers = await cache.aget(WORKERS_KEY) or set()
+        if worker not in workers:
+            await cache.aset(WORKERS_KEY, workers | {worker}, None)
+
+
+registry = Registry()
+
+
+def _merged():
+    registry.publish(force=True)
+    workers = cache.get(WORKERS_KEY) or set()
+    snapshots = cache.get_many([WORKER_KEY.format(worker) for worker in workers])
+    if len(snapshots) < len(workers):
+        # Снимки остановленных воркеров истекли
+        cache.set(
+            WORKERS_KEY,
+            {worker for worker in workers if WORKER_KEY.format(worker) in snapshots},
+            None,
+        )
+    merged = {}
+    for snapshot in snapshots.values():
+        for key, value in snapshot.items():
+            if key not in merged:
+                merged[key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                merged[key] = [a + b for a, b in zip(merged[key], value)]
+            else:
+                merged[key] += value
+    return merged
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _sample(name, labels, value):
+    if not labels:
+        return f"{name} {_number(value)}"
+    pairs = ",".join(
+        '{}="{}"'.format(
+            label,
+            str(text).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for label, text in labels
+    )
+    return f"{name}{{{pairs}}} {_number(value)}"
+
+
+# Текстовый формат Prometheus 0.0.4
+def render():
+    values = _merged()
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), value in sorted(values.items(), key=lambda item: item[0]):
+            if metric != name:
+                continue
+            if kind != "histogram":
+                lines.append(_sample(name, labels, value))
+                continue
+            for bound, count in zip(buckets, value):
+                lines.append(_sample(f"{name}_bucket", labels + (("le", bound),), count))
+            lines.append(_sample(f"{name}_bucket", labels + (("le", "+Inf"),), value[-1]))
+            lines.append(_sample(f"{name}_sum", labels, value[-2]))
+            lines.append(_sample(f"{name}_count", labels, value[-1]))
+    return "\n".join(lines) + "\n"
+
+
+# Доступ к /metrics только с токеном METRICS_TOKEN; пока токен не задан,
+# метрики не отдаются никому
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if not token or not constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponse(status=401)
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Представление DRF с действием (RecipeViewSet.download_shopping_cart),
+# для остальных — имя маршрута или функции
+def view_name(match, method):
+    if match is None:
+        return "unmatched"
+    cls = getattr(match.func, "cls", None)
+    if cls is None:
+        return match.view_name or match.func.__name__
+    actions = getattr(match.func, "actions", None) or {}
+    action = actions.get(method.lower())
+    return f"{cls.__name__}.{action}" if action else cls.__name__
+
+
+def _count_bytes(response, view):
+    content = response.streaming_content
+
+    def counted():
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.inc("foodgram_response_bytes_total", {"view": view}, size)
+
+    async def acounted():
+        size = 0
+        try:
+            async for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.inc("foodgram_response_bytes_total", {"view": view}, size)
+
+    response.streaming_content = acounted() if response.is_async else counted()
+
+
+def _log_slow(request, view, duration, recorder):
+    lines = [
+        f"{elapsed * 1000:8.1f} мс  {sql}"
+        for elapsed, sql in sorted(recorder.slowest, reverse=True)
+    ]
+    lines += [f"{count:6d} раз  {sql}" for sql, count in recorder.duplicated()]
+    logger.warning(
+        "Медленный запрос %s %s (%s): %.0f мс, SQL: %d за %.0f мс, повторов: %d, "
+        "сериализация: %.0f мс\n%s",
+        request.method,
+        request.get_full_path(),
+        view,
+        duration * 1000,
+        recorder.queries,
+        recorder.query_time * 1000,
+        recorder.duplicates(),
+        recorder.serializer_time * 1000,
+        "\n".join(lines),
+    )
+
+
+def _finish(request, response, recorder, duration):
+    view = view_name(getattr(request, "resolver_match", None), request.method)
+    if view == "metrics":
+        return
+    labels = {"view": view}
+    registry.inc(
+        "foodgram_requests_total",
+        {**labels, "method": request.method, "status": response.status_code},
+    )
+    registry.observe("foodgram_request_duration_seconds", labels, duration)
+    registry.observe("foodgram_db_queries", labels, recorder.queries)
+    registry.inc("foodgram_db_query_seconds_total", labels, recorder.query_time)
+    registry.inc("foodgram_db_duplicate_queries_total", labels, recorder.duplicates())
+    registry.inc("foodgram_serializer_seconds_total", labels, recorder.serializer_time)
+    if response.streaming:
+        _count_bytes(response, view)
+    else:
+        registry.inc("foodgram_response_bytes_total", labels, len(response.content))
+    if duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+        registry.inc("foodgram_slow_requests_total", labels)
+        _log_slow(request, view, duration, recorder)
+
+
+# Время ответа, число и время SQL-запросов, повторы одинаковых запросов,
+# время сериализации и размер ответа по представлениям. Ставится первым
+# в MIDDLEWARE. Запросы к базе после возврата ответа (потоковая выдача)
+# в замер не попадают.
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    _instrument_serializers()
+    query_hooks.install_all()
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            recorder = Recorder()
+            token = _recorder.set(recorder)
+            observer = query_hooks.add_observer(recorder.add_query)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                query_hooks.remove_observer(observer)
+                _recorder.reset(token)
+            _finish(request, response, recorder, time.perf_counter() - started)
+            await registry.apublish()
+            return response
+
+    else:
+
+        def middleware(request):
+            recorder = Recorder()
+            token = _recorder.set(recorder)
+            observer = query_hooks.add_observer(recorder.add_query)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                query_hooks.remove_observer(observer)
+                _recorder.reset(token)
+            _finish(request, response, recorder, time.perf_counter() - started)
+            registry.publish()
+            return response
+
+    return middleware
@@ -0,0 +1,24 @@
+# Счётчики, рейтинги и варианты изображений пишутся атомарным UPDATE
+# в обход экземпляра модели. Полное сохранение устаревшего экземпляра
+# (например, user.save() при смене пароля или правка рецепта в админке)
+# записало бы поверх прочитанные раньше значения, поэтому save() без
+# update_fields сохраняет все поля, кроме перечисленных в protected_fields.
+class CounterFieldsMixin:
+    protected_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+            and not self._state.adding
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.protected_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,251 @@
+import cProfile
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+from rest_framework.authtoken.models import Token
+
+from . import query_hooks
+from .metrics import view_name
+
+logger = logging.getLogger(__name__)
+
+MODES = {"cprofile": ".prof", "sample": ".folded"}
+HEADER = "X-Profile"
+QUERY_PARAM = "profile"
+
+# Профилируется один запрос на процесс: cProfile в новых версиях Python
+# не допускает двух профилировщиков одновременно, а замер второго
+# параллельного запроса был бы искажён первым
+_busy = threading.Lock()
+
+
+def _frame_name(code):
+    path = "/".join(Path(code.co_filename).parts[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+# Профилировщик по выборкам: раз в PROFILING_SAMPLE_INTERVAL секунд снимает
+# стек потока запроса. Стеки пишутся в свёрнутом формате (frame;frame count),
+# который понимают flamegraph.pl и speedscope.
+class SamplingProfiler:
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(settings.PROFILING_SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def dump_stats(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _flag(request):
+    value = request.headers.get(HEADER) or request.GET.get(QUERY_PARAM)
+    if not value:
+        return None
+    return value if value in MODES else "cprofile"
+
+
+def _token_key(request):
+    keyword, _, key = request.headers.get("Authorization", "").partition(" ")
+    return key if keyword == "Token" and key else None
+
+
+def _is_staff(request):
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    key = _token_key(request)
+    return key is not None and (
+        Token.objects.filter(key=key, user__is_active=True, user__is_staff=True).exists()
+    )
+
+
+async def _ais_staff(request):
+    if hasattr(request, "auser"):
+        user = await request.auser()
+        if user.is_authenticated:
+            return user.is_staff
+    key = _token_key(request)
+    return key is not None and (
+        await Token.objects.filter(
+            key=key, user__is_active=True, user__is_staff=True
+        ).aexists()
+    )
+
+
+# Случайные PROFILING_SAMPLE_PERCENT процентов запросов; если задан
+# PROFILING_SAMPLE_VIEWS — только к этим представлениям
+def _sampled(request):
+    percent = settings.PROFILING_SAMPLE_PERCENT
+    if not percent or random.random() * 100 >= percent:
+        return False
+    if not settings.PROFILING_SAMPLE_VIEWS:
+        return True
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    return view_name(match, request.method) in settings.PROFILING_SAMPLE_VIEWS
+
+
+def _prune(directory):
+    captures = sorted(directory.glob("*.json"))
+    for meta in captures[: max(0, len(captures) - settings.PROFILING_MAX_CAPTURES)]:
+        for path in directory.glob(f"{meta.stem}.*"):
+            path.unlink(missing_ok=True)
+
+
+# Профиль одного запроса: профилировщик, журнал SQL и сведения о запросе
+class Capture:
+    def __init__(self, mode, reason):
+        self.mode = mode
+        self.reason = reason
+        self.queries = []
+        if mode == "sample":
+            self.profiler = SamplingProfiler(threading.get_ident())
+        else:
+            self.profiler = cProfile.Profile()
+
+    def add_query(self, sql, duration):
+        if len(self.queries) < settings.PROFILING_MAX_QUERIES:
+            self.queries.append({"sql": sql, "time_ms": round(duration * 1000, 3)})
+
+    def start(self):
+        self._observer = query_hooks.add_observer(self.add_query)
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    # Профилировщик останавливается в том же потоке, где был запущен
+    def stop(self):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+        query_hooks.remove_observer(self._observer)
+
+    def save(self, request, response):
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        now = timezone.now()
+        capture_id = f"{now:%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        profile = f"{capture_id}{MODES[self.mode]}"
+        self.profiler.dump_stats(directory / profile)
+        meta = {
+            "id": capture_id,
+            "created": now.isoformat(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": view_name(getattr(request, "resolver_match", None), request.method),
+            "status": response.status_code,
+            "duration_ms": round(self.duration * 1000, 1),
+            "mode": self.mode,
+            "reason": self.reason,
+            "profile": profile,
+            "queries": self.queries,
+        }
+        with open(directory / f"{capture_id}.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        _prune(directory)
+        return capture_id
+
+
+def _start(mode, reason):
+    if not _busy.acquire(blocking=False):
+        return None
+    capture = Capture(mode, reason)
+    capture.start()
+    return capture
+
+
+# Запись профиля на диск; под ASGI выполняется вне цикла событий
+def _finish(capture, request, response):
+    try:
+        if response is not None:
+            response["X-Profile-Id"] = capture.save(request, response)
+    except OSError:
+        logger.exception("Не удалось сохранить профиль запроса")
+    finally:
+        _busy.release()
+
+
+# Профилирование запросов на работающем сервере. Сотрудник включает его
+# заголовком X-Profile или параметром ?profile= со значением cprofile или
+# sample; кроме того, сами профилируются PROFILING_SAMPLE_PERCENT процентов
+# запросов. Профиль, журнал SQL и сведения о запросе пишутся в PROFILING_DIR,
+# id записи возвращается в заголовке X-Profile-Id (команда show_profiles).
+# Под ASGI профиль охватывает только код в цикле событий, а потоковый ответ
+# профилируется до начала выдачи.
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    query_hooks.install_all()
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            mode = _flag(request)
+            if mode is not None and await _ais_staff(request):
+                capture = _start(mode, "requested")
+            elif _sampled(request):
+                capture = _start(settings.PROFILING_SAMPLE_MODE, "sampled")
+            else:
+                capture = None
+            if capture is None:
+                return await get_response(request)
+            response = None
+            try:
+                response = await get_response(request)
+            finally:
+                capture.stop()
+                await sync_to_async(_finish)(capture, request, response)
+            return response
+
+    else:
+
+        def middleware(request):
+            mode = _flag(request)
+            if mode is not None and _is_staff(request):
+                capture = _start(mode, "requested")
+            elif _sampled(request):
+                capture = _start(settings.PROFILING_SAMPLE_MODE, "sampled")
+            else:
+                capture = None
+            if capture is None:
+                return get_response(request)
+            response = None
+            try:
+                response = get_response(request)
+            finally:
+                capture.stop()
+                _finish(capture, request, response)
+            return response
+
+    return middleware
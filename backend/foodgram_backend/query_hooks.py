@@ -0,0 +1,48 @@
+import time
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_observers = ContextVar("query_observers", default=())
+
+
+# Одна обёртка execute на соединение для всех, кто замеряет SQL (метрики,
+# профилировщик). Наблюдатели текущего запроса получают (sql, время).
+def _observe(execute, sql, params, many, context):
+    observers = _observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for observer in observers:
+            observer(sql, duration)
+
+
+# Обёртка ставится первой: контекстный менеджер execute_wrapper снимает
+# последнюю обёртку списка, и наша не должна оказаться на её месте
+def install(connection):
+    if _observe not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _observe)
+
+
+def install_all():
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+@receiver(connection_created)
+def instrument_connection(connection, **kwargs):
+    install(connection)
+
+
+def add_observer(observer):
+    return _observers.set(_observers.get() + (observer,))
+
+
+def remove_observer(token):
+    _observers.reset(token)
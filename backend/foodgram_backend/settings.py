@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -36,6 +37,11 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "foodgram_backend.urls"
 
+# Режим сервера: wsgi (gunicorn с потоками) или asgi (gunicorn с воркерами
+# uvicorn). В режиме asgi подключаются асинхронные представления api.async_views
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+ASYNC_VIEWS = SERVER_MODE == "asgi"
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -54,12 +60,81 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "foodgram_backend.wsgi.application"
 
-DATABASES = {
+# База данных: SQLite по умолчанию, PostgreSQL при DB_ENGINE=postgresql.
+# Соединения живут DB_CONN_MAX_AGE секунд и проверяются перед повторным
+# использованием. Под ASGI постоянные соединения не переиспользуются между
+# запросами, там нужен пул: DB_POOL=true (psycopg 3, Django 5.1+).
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+
+
+def postgres_database(host, port):
+    database = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.getenv("POSTGRES_DB", "foodgram"),
+        "USER": os.getenv("POSTGRES_USER", "foodgram_user"),
+        "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+        "HOST": host,
+        "PORT": port,
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 0 if ASYNC_VIEWS else 60)),
+        "CONN_HEALTH_CHECKS": True,
+    }
+    if os.getenv("DB_POOL", "").lower() == "true":
+        database["CONN_MAX_AGE"] = 0
+        database["OPTIONS"] = {
+            "pool": {
+                "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+                "max_size": int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+                "timeout": int(os.getenv("DB_POOL_TIMEOUT", 10)),
+            }
+        }
+    return database
+
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": postgres_database(
+            os.getenv("DB_HOST", "db"), os.getenv("DB_PORT", "5432")
+        )
+    }
+    if os.getenv("DB_REPLICA_HOST"):
+        DATABASES["replica"] = postgres_database(
+            os.getenv("DB_REPLICA_HOST"), os.getenv("DB_REPLICA_PORT", "5432")
+        )
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
+    }
+    # Локальная проверка маршрутизации: «реплика» — отдельное соединение
+    # с тем же файлом
+    if os.getenv("DB_REPLICA") == "mirror":
+        DATABASES["replica"] = dict(DATABASES["default"])
+
+# Безопасные запросы читают с реплики, если она задана
+DB_REPLICA_PIN_SECONDS = int(os.getenv("DB_REPLICA_PIN_SECONDS", 5))
+if "replica" in DATABASES:
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    DATABASE_ROUTERS = ["foodgram_backend.db_routing.ReplicaRouter"]
+    MIDDLEWARE.insert(0, "foodgram_backend.db_routing.replica_middleware")
+
+# Версии справочников и кешей ответов хранятся в кеше по умолчанию, поэтому
+# при нескольких воркерах он должен быть общим (Redis). LocMemCache годится
+# только для разработки и одного воркера.
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "foodgram",
     }
 }
+if os.getenv("REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL"),
+    }
+
+RECIPE_CACHE_TIMEOUT = 300
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -100,6 +175,11 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ),
+    "DEFAULT_PARSER_CLASSES": (
+        "api.parsers.StreamingJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 6,
 }
@@ -116,3 +196,77 @@ DJOSER = {
         "user_list": ["rest_framework.permissions.AllowAny"],
     },
 }
+
+SHOPPING_LIST_PDF_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+INGREDIENT_SEARCH_LIMIT = 20
+
+# Полнотекстовый поиск рецептов: период обновления словаря опечаток
+RECIPE_SEARCH_VOCABULARY_TTL = 600
+
+# Короткие ссылки: соль алфавита кодов и порог записи счётчиков переходов
+SHORT_LINK_SALT = os.getenv("SHORT_LINK_SALT", "foodgram")
+SHORT_LINK_FLUSH_CLICKS = 100
+SHORT_LINK_FLUSH_SECONDS = 30
+
+# Ленты подписок: с какого числа подписчиков рецепты автора не раскладываются
+# по лентам, а подмешиваются при чтении, и сколько рецептов автора попадает
+# в ленту при подписке
+FEED_FANOUT_MAX_SUBSCRIBERS = 1000
+FEED_BACKFILL_RECIPES = 100
+
+# Рейтинги рецептов (recipes.ranking): веса добавления в избранное и в корзину,
+# периоды полураспада популярности и рейтинга в тренде, окно рейтинга в тренде
+RECIPE_SCORE_FAVORITE_WEIGHT = 2.0
+RECIPE_SCORE_CART_WEIGHT = 1.0
+RECIPE_POPULARITY_HALF_LIFE_DAYS = 30
+RECIPE_TRENDING_HALF_LIFE_HOURS = 24
+RECIPE_TRENDING_WINDOW_DAYS = 7
+
+# Сколько хранить в кеше избранное, корзину и подписки пользователя
+VIEWER_STATE_CACHE_TIMEOUT = 300
+
+# Обработка изображений: пул проверки загрузок и фоновая сборка вариантов
+IMAGE_DECODE_WORKERS = 4
+IMAGE_DECODE_TIMEOUT = 10
+IMAGE_MAX_PIXELS = 40_000_000
+# Предел размера изображения (как client_max_body_size в nginx) и сколько
+# байт загрузки держать в памяти, прежде чем выгрузить её во временный файл
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_SPOOL_MAX_MEMORY = 512 * 1024
+IMAGE_TASK_WORKERS = 2
+IMAGE_BROKER = "api.images.LocalBroker"
+
+# Загрузки хранятся под именами по хешу содержимого, одинаковые файлы не дублируются
+STORAGES = {
+    "default": {"BACKEND": "api.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# Метрики запросов (foodgram_backend.metrics) на /metrics: порог медленного
+# запроса для журнала, сколько одинаковых SQL-запросов считать N+1, сколько
+# самых долгих запросов писать в журнал и как часто воркер публикует снимок.
+# По умолчанию выключены, а /metrics отвечает только при заданном METRICS_TOKEN
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_SLOW_REQUEST_MS = int(os.getenv("METRICS_SLOW_REQUEST_MS", 500))
+METRICS_DUPLICATE_QUERIES = 3
+METRICS_SLOW_LOG_QUERIES = 5
+METRICS_PUBLISH_SECONDS = 10
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, "foodgram_backend.metrics.metrics_middleware")
+
+# Профилирование запросов (foodgram_backend.profiling): сотрудник включает его
+# заголовком X-Profile или параметром ?profile=; кроме того, профилируются
+# PROFILING_SAMPLE_PERCENT процентов запросов к представлениям из
+# PROFILING_SAMPLE_VIEWS (или ко всем, если список пуст)
+PROFILING_DIR = os.getenv("PROFILING_DIR", str(BASE_DIR / "profiles"))
+PROFILING_SAMPLE_PERCENT = float(os.getenv("PROFILING_SAMPLE_PERCENT", 0))
+PROFILING_SAMPLE_VIEWS = [
+    view for view in os.getenv("PROFILING_SAMPLE_VIEWS", "").split(",") if view
+]
+PROFILING_SAMPLE_MODE = os.getenv("PROFILING_SAMPLE_MODE", "cprofile")
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_MAX_CAPTURES = 200
+PROFILING_MAX_QUERIES = 1000
+MIDDLEWARE.append("foodgram_backend.profiling.profiling_middleware")
@@ -1,20 +1,33 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from api import async_views
+from foodgram_backend import metrics
 from api.ingredients_views import IngredientViewSet
 from api.recipes_views import RecipeViewSet
+from api.short_links_views import short_link_redirect
+from api.tags_views import TagViewSet
 from api.users_views import UserViewSet
 
 router = DefaultRouter()
 router.register(r"ingredients", IngredientViewSet, basename="ingredients")
 router.register(r"recipes", RecipeViewSet, basename="recipes")
+router.register(r"tags", TagViewSet, basename="tags")
 router.register(r"users", UserViewSet, basename="users")
-# Добавь остальные маршруты (например, tags, subscriptions) при необходимости
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(router.urls)),
     path("api/auth/", include("djoser.urls")),
     path("api/auth/", include("djoser.urls.authtoken")),
+    path("s/<str:code>", short_link_redirect, name="short-link"),
 ]
+
+# Под ASGI самые частые GET-запросы обслуживают асинхронные представления
+if settings.ASYNC_VIEWS:
+    urlpatterns.insert(1, path("api/", include(async_views.urlpatterns(router))))
+
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path("metrics", metrics.metrics_view, name="metrics"))
@@ -0,0 +1,80 @@
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.checks import Tags, Warning, register
+from django.db import transaction
+
+from .db_routing import primary
+
+
+# Версии данных в общем кеше. Версия — случайный токен: ключи, построенные
+# на старой версии, после смены просто перестают читаться. Первым токен
+# записывает add, поэтому параллельные процессы сходятся на одном значении.
+def current(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def acurrent(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump(*keys):
+    cache.set_many(dict.fromkeys(keys, uuid.uuid4().hex), timeout=None)
+
+
+# Сбрасываем после коммита, иначе параллельный запрос закеширует старые данные
+def bump_on_commit(*keys):
+    transaction.on_commit(lambda: bump(*keys))
+
+
+# Снимок данных в памяти процесса, который перечитывается при смене версии
+# в общем кеше. Наследники задают version_key и реализуют _reload.
+class VersionedSnapshot:
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+
+    def _reload(self):
+        raise NotImplementedError
+
+    def _ensure_fresh(self):
+        version = current(self.version_key)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                with primary():
+                    self._reload()
+                self._version = version
+
+    def invalidate(self):
+        bump(self.version_key)
+
+
+# Версии сравниваются между процессами только через общий кеш. С LocMemCache
+# у каждого воркера свои версии: изменения, сделанные через другой воркер,
+# в справочниках и кешах ответов не видны до перезапуска.
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if settings.CACHES["default"]["BACKEND"].endswith("LocMemCache"):
+        return [
+            Warning(
+                "Кеш по умолчанию локален для процесса, версии справочников "
+                "и кешей ответов не общие для воркеров.",
+                hint="Задайте REDIS_URL или запускайте один воркер.",
+                id="foodgram.W001",
+            )
+        ]
+    return []
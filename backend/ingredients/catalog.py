@@ -0,0 +1,57 @@
+from bisect import bisect_left
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram_backend.versioned_cache import VersionedSnapshot
+
+from .models import Ingredient
+
+VERSION_KEY = "ingredients:catalog:version"
+
+
+# Отсортированный по названию справочник ингредиентов в памяти процесса.
+# Версия хранится в общем кеше: любое изменение ингредиентов меняет её,
+# и каждый процесс перечитывает таблицу при следующем запросе.
+class IngredientCatalog(VersionedSnapshot):
+    version_key = VERSION_KEY
+
+    def __init__(self):
+        super().__init__()
+        self._keys = []
+        self._items = []
+
+    def _reload(self):
+        rows = sorted(
+            (name.lower(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.order_by().values_list(
+                "id", "name", "measurement_unit"
+            )
+        )
+        self._keys = [row[0] for row in rows]
+        self._items = [
+            {"id": pk, "name": name, "measurement_unit": measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+
+    def search(self, prefix, limit=None):
+        self._ensure_fresh()
+        keys, items = self._keys, self._items
+        prefix = prefix.lower()
+        start = bisect_left(keys, prefix)
+        result = []
+        for index in range(start, len(keys)):
+            if not keys[index].startswith(prefix) or len(result) == limit:
+                break
+            result.append(items[index])
+        return result
+
+
+ingredient_catalog = IngredientCatalog()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_catalog(**kwargs):
+    transaction.on_commit(ingredient_catalog.invalidate)
@@ -1,29 +1,114 @@
-from django.core.management.base import BaseCommand
-from ingredients.models import Ingredient
+import csv
 import json
 import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ingredients.catalog import ingredient_catalog
+from ingredients.models import Ingredient
+
+DEFAULT_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../../../data/ingredients.json")
+)
+READ_SIZE = 64 * 1024
+
+
+def read_csv(f):
+    for row in csv.reader(f):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(f):
+    # Читаем массив объектов по частям, не загружая файл целиком
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+    while True:
+        if not eof and len(buffer) - position < READ_SIZE:
+            chunk = f.read(READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise ValueError("Неожиданный конец JSON-файла")
+            continue
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("Ожидается JSON-массив ингредиентов")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Объект разрезан границей чтения, дочитываем следующий блок
+            chunk = f.read(READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item["name"], item["measurement_unit"]
+
+
+READERS = {"csv": read_csv, "json": read_json}
 
 
 class Command(BaseCommand):
-    help = 'Загружает ингредиенты из файла data/ingredients.json'
+    help = "Загружает ингредиенты из CSV- или JSON-файла (по умолчанию data/ingredients.json)"
 
-    def handle(self, *args, **kwargs):
-        # Определяем путь к файлу относительно папки manage.py
-        file_path = os.path.abspath(os.path.join(
-            os.path.dirname(__file__), '../../../data/ingredients.json'))
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default=DEFAULT_PATH)
+        parser.add_argument(
+            "--format",
+            choices=READERS,
+            help="Формат файла; по умолчанию определяется по расширению",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        file_path = options["path"]
         if not os.path.exists(file_path):
-            self.stderr.write(self.style.ERROR(f'Файл {file_path} не найден.'))
-            return
+            raise CommandError(f"Файл {file_path} не найден.")
+        file_format = options["format"] or os.path.splitext(file_path)[1][1:].lower()
+        if file_format not in READERS:
+            raise CommandError(f"Неизвестный формат файла: {file_format}")
+
+        started = time.perf_counter()
+        count_before = Ingredient.objects.count()
+        seen = set()
+        batch = []
+        total = 0
+        with open(file_path, encoding="utf-8", newline="") as f:
+            for name, measurement_unit in READERS[file_format](f):
+                key = (name.strip(), measurement_unit.strip())
+                total += 1
+                if not key[0] or key in seen:
+                    continue
+                seen.add(key)
+                batch.append(Ingredient(name=key[0], measurement_unit=key[1]))
+                if len(batch) >= options["batch_size"]:
+                    Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                    batch = []
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        # bulk_create не отправляет сигналы, поэтому сбрасываем справочник явно
+        ingredient_catalog.invalidate()
 
-        with open(file_path, encoding='utf-8') as f:
-            data = json.load(f)
-            count = 0
-            for item in data:
-                ingredient, created = Ingredient.objects.get_or_create(
-                    name=item['name'],
-                    measurement_unit=item['measurement_unit']
-                )
-                if created:
-                    count += 1
-            self.stdout.write(self.style.SUCCESS(
-                f'Загружено {count} новых ингредиентов'))
+        elapsed = time.perf_counter() - started
+        created = Ingredient.objects.count() - count_before
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Загружено {created} новых ингредиентов из {total} строк "
+                f"за {elapsed:.2f} с ({total / max(elapsed, 1e-9):.0f} строк/с)"
+            )
+        )
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:06
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    Ingredient = apps.get_model("ingredients", "Ingredient")
+    IngredientRecipe = apps.get_model("recipes", "IngredientRecipe")
+    ShoppingListItem = apps.get_model("recipes", "ShoppingListItem")
+    groups = (
+        Ingredient.objects.values("name", "measurement_unit")
+        .annotate(keep=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    for group in groups:
+        extra = Ingredient.objects.filter(
+            name=group["name"], measurement_unit=group["measurement_unit"]
+        ).exclude(id=group["keep"])
+        for model, owner, limit in (
+            (IngredientRecipe, "recipe_id", 32000),
+            (ShoppingListItem, "user_id", None),
+        ):
+            for row in model.objects.filter(ingredient__in=extra):
+                target = model.objects.filter(
+                    ingredient_id=group["keep"], **{owner: getattr(row, owner)}
+                ).first()
+                if target is None:
+                    row.ingredient_id = group["keep"]
+                    row.save(update_fields=["ingredient"])
+                    continue
+                target.amount += row.amount
+                if limit is not None:
+                    target.amount = min(target.amount, limit)
+                target.save(update_fields=["amount"])
+                row.delete()
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ingredients", "0003_alter_ingredient_options_and_more"),
+        ("recipes", "0005_shoppinglistitem"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="ingredient",
+            constraint=models.UniqueConstraint(
+                fields=("name", "measurement_unit"), name="unique_ingredient_unit"
+            ),
+        ),
+    ]
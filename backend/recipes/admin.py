@@ -3,13 +3,16 @@ from .models import Recipe, Tag, IngredientRecipe, Favorite
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorites_count')
+    list_display = (
+        'name', 'author', 'favorites_count', 'in_carts_count', 'short_link_clicks'
+    )
     search_fields = ('name', 'author__username')
     list_filter = ('author', 'tags')
-
-    def favorites_count(self, obj):
-        return obj.in_favorites.count()
-    favorites_count.short_description = 'Количество в избранном'
+    list_select_related = ('author',)
+    readonly_fields = (
+        'favorites_count', 'in_carts_count', 'short_code', 'short_link_clicks',
+        'popularity', 'trending', 'image_variants',
+    )
 
 
 admin.site.register(Recipe, RecipeAdmin)
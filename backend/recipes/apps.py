@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from . import (  # noqa: F401
+            catalog,
+            cookable,
+            counters,
+            search,
+            shopping_list,
+            short_links,
+            timelines,
+        )
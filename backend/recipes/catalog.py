@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram_backend.versioned_cache import VersionedSnapshot
+
+from .models import Tag
+
+VERSION_KEY = "recipes:tags:version"
+
+
+# Справочник тегов в памяти процесса. Тегов немного и меняются они редко,
+# поэтому выдача тегов и их разбор в рецептах обходятся без запросов к БД.
+# Версия хранится в общем кеше, как у справочника ингредиентов.
+class TagCatalog(VersionedSnapshot):
+    version_key = VERSION_KEY
+
+    def __init__(self):
+        super().__init__()
+        self._tags = []
+        self._by_id = {}
+        self._by_slug = {}
+
+    def _reload(self):
+        tags = list(Tag.objects.order_by("name").values("id", "name", "color", "slug"))
+        self._by_id = {tag["id"]: tag for tag in tags}
+        self._by_slug = {tag["slug"]: tag for tag in tags}
+        self._tags = tags
+
+    def all(self):
+        self._ensure_fresh()
+        return self._tags
+
+    def get(self, tag_id):
+        self._ensure_fresh()
+        return self._by_id.get(tag_id)
+
+    # Словарь не меняется на месте: при перечитывании создаётся новый
+    def by_id(self):
+        self._ensure_fresh()
+        return self._by_id
+
+    def ids(self):
+        self._ensure_fresh()
+        return self._by_id.keys()
+
+    def ids_for_slugs(self, slugs):
+        self._ensure_fresh()
+        return [self._by_slug[slug]["id"] for slug in slugs if slug in self._by_slug]
+
+
+tag_catalog = TagCatalog()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_catalog(**kwargs):
+    transaction.on_commit(tag_catalog.invalidate)
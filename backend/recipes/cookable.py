@@ -0,0 +1,247 @@
+import threading
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import groupby, islice
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram_backend import versioned_cache
+from foodgram_backend.db_routing import primary
+
+from .models import IngredientRecipe, Recipe
+
+GENERATION_KEY = "recipes:cookable:generation"
+SEQUENCE_KEY = "recipes:cookable:sequence"
+CHANGE_KEY = "recipes:cookable:change:{}"
+# Журнал изменений длиннее MAX_CHANGES записей или с истёкшими записями
+# заменяется полной перезагрузкой индекса
+CHANGE_TIMEOUT = 60 * 60
+MAX_CHANGES = 1000
+# Сколько битовых множеств ингредиентов держать готовыми между запросами
+HOT_BITSETS = 256
+
+
+def _bitset(positions, length):
+    bits = bytearray(length // 8 + 1)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _positions(bits):
+    # От старших позиций к младшим: новые рецепты раньше
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for offset in range(len(data) - 1, -1, -1):
+        byte = data[offset]
+        while byte:
+            bit = byte.bit_length() - 1
+            yield offset * 8 + bit
+            byte ^= 1 << bit
+
+
+# Битовые срезы счётчиков: counters[i] хранит i-й разряд счётчика
+# каждой позиции, поэтому прибавление множества — это двоичный сумматор.
+def _add(counters, bits):
+    for index, counter in enumerate(counters):
+        counters[index], bits = counter ^ bits, counter & bits
+        if not bits:
+            return
+    counters.append(bits)
+
+
+def _equal(counters, value, mask):
+    if value >> len(counters):
+        return 0
+    for index, counter in enumerate(counters):
+        mask &= counter if value >> index & 1 else ~counter
+    return mask
+
+
+# Инвертированный индекс «ингредиент → рецепты» в памяти процесса.
+# Каждому рецепту выдаётся позиция; для ингредиента хранится массив
+# позиций, из которого при запросе строится битовое множество. Изменённый
+# рецепт получает новую позицию в конце, а старая гасится в маске alive.
+# Процессы узнают об изменениях из журнала в общем кеше.
+class CookableIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = None
+        self._sequence = 0
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}
+        self._recipe_ids = array("q")
+        self._sorted = 0
+        self._moved = {}
+        self._sizes = defaultdict(list)
+        self._by_size = {}
+        self._alive = 0
+        self._dead = 0
+        self._bitsets = {}
+
+    def _rows(self, recipe_ids=None):
+        rows = IngredientRecipe.objects.order_by("recipe_id")
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        rows = rows.values_list("recipe_id", "ingredient_id").iterator(chunk_size=10000)
+        for recipe_id, group in groupby(rows, key=lambda row: row[0]):
+            yield recipe_id, {ingredient_id for _, ingredient_id in group}
+
+    def _append(self, recipe_id, ingredient_ids):
+        position = len(self._recipe_ids)
+        self._recipe_ids.append(recipe_id)
+        for ingredient_id in ingredient_ids:
+            self._postings.setdefault(ingredient_id, array("l")).append(position)
+        return position
+
+    def _load(self):
+        self._reset()
+        for recipe_id, ingredient_ids in self._rows():
+            position = self._append(recipe_id, ingredient_ids)
+            self._sizes[len(ingredient_ids)].append(position)
+        length = len(self._recipe_ids)
+        self._sorted = length
+        self._by_size = {
+            size: _bitset(positions, length) for size, positions in self._sizes.items()
+        }
+        self._sizes = None
+        self._alive = (1 << length) - 1
+
+    def _position(self, recipe_id):
+        if recipe_id in self._moved:
+            return self._moved[recipe_id]
+        index = bisect_left(self._recipe_ids, recipe_id, 0, self._sorted)
+        if index < self._sorted and self._recipe_ids[index] == recipe_id:
+            return index
+        return None
+
+    def _apply(self, recipe_ids):
+        for recipe_id in recipe_ids:
+            position = self._position(recipe_id)
+            if position is not None and self._alive >> position & 1:
+                self._alive ^= 1 << position
+                self._dead += 1
+        for recipe_id, ingredient_ids in self._rows(recipe_ids):
+            position = self._append(recipe_id, ingredient_ids)
+            self._moved[recipe_id] = position
+            size = len(ingredient_ids)
+            self._by_size[size] = self._by_size.get(size, 0) | 1 << position
+            self._alive |= 1 << position
+            for ingredient_id in ingredient_ids:
+                self._bitsets.pop(ingredient_id, None)
+
+    def _sync(self):
+        generation = versioned_cache.current(GENERATION_KEY)
+        sequence = cache.get(SEQUENCE_KEY, 0)
+        if generation == self._generation and sequence == self._sequence:
+            return
+        changes = None
+        if (
+            generation == self._generation
+            and self._sequence < sequence <= self._sequence + MAX_CHANGES
+        ):
+            keys = [CHANGE_KEY.format(n) for n in range(self._sequence + 1, sequence + 1)]
+            changes = cache.get_many(keys)
+            if len(changes) != len(keys):
+                changes = None
+        with primary():
+            if changes is None or self._dead > len(self._recipe_ids) // 4:
+                self._load()
+            else:
+                self._apply(set().union(*changes.values()))
+        self._generation, self._sequence = generation, sequence
+
+    def _ingredient_bits(self, ingredient_id):
+        bits = self._bitsets.get(ingredient_id)
+        if bits is None:
+            positions = self._postings.get(ingredient_id)
+            if not positions:
+                return 0
+            bits = _bitset(positions, len(self._recipe_ids))
+            if len(self._bitsets) >= HOT_BITSETS:
+                self._bitsets.pop(next(iter(self._bitsets)))
+            self._bitsets[ingredient_id] = bits
+        return bits
+
+    # Рецепты, где есть хотя бы один из ингредиентов, в виде пар
+    # (id рецепта, сколько ингредиентов не хватает): сначала те, что можно
+    # приготовить целиком, затем по возрастанию недостающих. Возвращает
+    # общее число таких рецептов и пары с offset по offset + limit: группы
+    # до offset пропускаются по числу бит, позиции перебираются до конца
+    # страницы.
+    def rank(self, ingredient_ids, max_missing=None, offset=0, limit=None):
+        ingredient_ids = set(ingredient_ids)
+        with self._lock:
+            self._sync()
+            counters = []
+            candidates = 0
+            for ingredient_id in ingredient_ids:
+                bits = self._ingredient_bits(ingredient_id)
+                if bits:
+                    candidates |= bits
+                    _add(counters, bits)
+            candidates &= self._alive
+
+            groups = defaultdict(int)
+            for size, recipes in self._by_size.items():
+                recipes &= candidates
+                if not recipes:
+                    continue
+                for matched in range(1, min(size, len(ingredient_ids)) + 1):
+                    missing = size - matched
+                    if max_missing is None or missing <= max_missing:
+                        groups[missing] |= _equal(counters, matched, recipes)
+            # Массив позиций только дополняется, а при перезагрузке
+            # заменяется новым, поэтому страницу можно собрать без блокировки
+            recipe_ids = self._recipe_ids
+
+        count = sum(bits.bit_count() for bits in groups.values())
+        page = []
+        for missing in sorted(groups):
+            if limit is not None and len(page) >= limit:
+                break
+            size = groups[missing].bit_count()
+            if offset >= size:
+                offset -= size
+                continue
+            stop = None if limit is None else offset + limit - len(page)
+            page.extend(
+                (recipe_ids[position], missing)
+                for position in islice(_positions(groups[missing]), offset, stop)
+            )
+            offset = 0
+        return count, page
+
+    def invalidate(self):
+        versioned_cache.bump(GENERATION_KEY)
+
+
+cookable_index = CookableIndex()
+
+
+def record_changes(recipe_ids):
+    recipe_ids = list(set(recipe_ids))
+
+    def publish():
+        cache.add(SEQUENCE_KEY, 0, timeout=None)
+        sequence = cache.incr(SEQUENCE_KEY)
+        cache.set(CHANGE_KEY.format(sequence), recipe_ids, CHANGE_TIMEOUT)
+
+    transaction.on_commit(publish)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    record_changes([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_changed(instance, **kwargs):
+    record_changes([instance.recipe_id])
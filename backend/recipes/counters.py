@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import Subscription
+from .models import Favorite, Recipe, ShoppingCart, User
+
+# (модель, поле-счётчик, модель связи, поле связи)
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "in_carts_count", ShoppingCart, "recipe"),
+    (User, "recipes_count", Recipe, "author"),
+    (User, "subscribers_count", Subscription, "author"),
+)
+
+
+# Атомарно меняет счётчик в базе, не читая текущее значение. Связь могла
+# появиться в обход сигналов (bulk_create, старые данные), поэтому счётчик
+# не опускается ниже нуля; точное значение вернёт reconcile.
+def change(model, pk, field, delta):
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    model.objects.filter(pk=pk).update(**{field: value})
+
+
+def _counters(source):
+    return [
+        (model, field, lookup)
+        for model, field, counted, lookup in COUNTERS
+        if counted is source
+    ]
+
+
+# Счётчики ведутся сигналами связей, поэтому учитываются и изменения из
+# админки, и каскадные удаления
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def relation_created(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    for model, field, lookup in _counters(sender):
+        change(model, getattr(instance, f"{lookup}_id"), field, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def relation_deleted(sender, instance, **kwargs):
+    for model, field, lookup in _counters(sender):
+        change(model, getattr(instance, f"{lookup}_id"), field, -1)
+
+
+def _actual(source, lookup):
+    total = (
+        source.objects.filter(**{lookup: OuterRef("pk")})
+        .order_by()
+        .values(lookup)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(total), 0)
+
+
+# Сверяет счётчики с таблицами связей и исправляет расхождения.
+# bulk_create и update сигналов не отправляют, поэтому после массовой
+# загрузки данных команду нужно запустить.
+# Возвращает число исправленных (или найденных при fix=False) строк по полям.
+def reconcile(fix=True):
+    result = {}
+    for model, field, source, lookup in COUNTERS:
+        stale = model.objects.alias(actual_count=_actual(source, lookup)).exclude(
+            **{field: F("actual_count")}
+        )
+        with transaction.atomic():
+            if fix:
+                count = model.objects.filter(pk__in=stale.values("pk")).update(
+                    **{field: _actual(source, lookup)}
+                )
+            else:
+                count = stale.count()
+        result[f"{model.__name__}.{field}"] = count
+    return result
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = "Пересобирает полнотекстовый индекс рецептов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if search.get_index() is None:
+            raise CommandError("Полнотекстовый поиск не поддерживается для этой базы")
+        count = search.rebuild(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано рецептов: {count}"))
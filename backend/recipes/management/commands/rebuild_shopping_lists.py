@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = "Пересобирает или проверяет сохранённые списки покупок пользователей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сверить сохранённые списки с корзинами",
+        )
+        parser.add_argument(
+            "--user", type=int, action="append", dest="users", help="id пользователя"
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["users"]
+        if options["verify"]:
+            mismatched = shopping_list.verify(user_ids)
+            if mismatched:
+                raise CommandError(
+                    f"Списки покупок расходятся с корзинами у пользователей: "
+                    f"{', '.join(map(str, mismatched))}"
+                )
+            self.stdout.write(self.style.SUCCESS("Списки покупок совпадают с корзинами"))
+            return
+
+        shopping_list.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS("Списки покупок пересобраны"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from recipes import timelines
+
+
+class Command(BaseCommand):
+    help = "Пересобирает ленты подписок пользователей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, action="append", dest="users", help="id пользователя"
+        )
+
+    def handle(self, *args, **options):
+        count = timelines.rebuild(options["users"])
+        self.stdout.write(self.style.SUCCESS(f"Ленты пересобраны, записей: {count}"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = "Сверяет счётчики избранного, корзин, рецептов и подписчиков с данными"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только найти расхождения, ничего не исправляя",
+        )
+
+    def handle(self, *args, **options):
+        result = counters.reconcile(fix=not options["check"])
+        for field, count in result.items():
+            self.stdout.write(f"{field}: {count}")
+        if options["check"] and any(result.values()):
+            raise CommandError("Счётчики расходятся с данными")
+        self.stdout.write(self.style.SUCCESS("Счётчики сверены"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes import ranking
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает популярность и рейтинг в тренде рецептов"
+
+    def handle(self, *args, **options):
+        count = ranking.recompute()
+        self.stdout.write(self.style.SUCCESS(f"Рейтинги пересчитаны, изменено: {count}"))
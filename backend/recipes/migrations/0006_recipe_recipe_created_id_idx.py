@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ingredients", "0005_ingredient_name_lower_idx"),
+        ("recipes", "0005_shoppinglistitem"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-created", "-id"], name="recipe_created_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (модель, поле-счётчик, модель связи, поле связи)
+COUNTERS = (
+    ("recipes.Recipe", "favorites_count", "recipes.Favorite", "recipe"),
+    ("recipes.Recipe", "in_carts_count", "recipes.ShoppingCart", "recipe"),
+    ("users.User", "recipes_count", "recipes.Recipe", "author"),
+    ("users.User", "subscribers_count", "users.Subscription", "author"),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, source_name, lookup in COUNTERS:
+        model = apps.get_model(model_name)
+        source = apps.get_model(source_name)
+        total = (
+            source.objects.filter(**{lookup: OuterRef("pk")})
+            .order_by()
+            .values(lookup)
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        model.objects.update(**{field: Coalesce(Subquery(total), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0006_recipe_recipe_created_id_idx"),
+        ("users", "0006_user_recipes_count_user_subscribers_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество в избранном"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="in_carts_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество в корзинах"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
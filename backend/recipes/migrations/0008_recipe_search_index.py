@@ -0,0 +1,55 @@
+from django.db import migrations
+
+
+# Индекс поиска живёт вне моделей: виртуальная таблица FTS5 в SQLite
+# или таблица с tsvector и GIN-индексом в PostgreSQL.
+# Заполняется командой rebuild_search_index и сигналами сохранения рецептов.
+# Схема записана здесь, а не берётся из recipes.search, чтобы миграция
+# не менялась вместе с кодом поиска.
+CREATE_SQL = {
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_search "
+        "USING fts5(name, ingredients, author, text, tokenize='unicode61')",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS recipes_search_vocab "
+        "USING fts5vocab(recipes_search, 'row')",
+    ],
+    "postgresql": [
+        "CREATE TABLE IF NOT EXISTS recipes_search ("
+        "recipe_id bigint PRIMARY KEY REFERENCES recipes_recipe (id) "
+        "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        "document tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS recipes_search_document_idx "
+        "ON recipes_search USING gin (document)",
+    ],
+}
+DROP_SQL = {
+    "sqlite": [
+        "DROP TABLE IF EXISTS recipes_search_vocab",
+        "DROP TABLE IF EXISTS recipes_search",
+    ],
+    "postgresql": ["DROP TABLE IF EXISTS recipes_search"],
+}
+
+
+def _execute(statements, schema_editor):
+    for statement in statements.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    _execute(CREATE_SQL, schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    _execute(DROP_SQL, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0007_recipe_favorites_count_recipe_in_carts_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+def assign_short_codes(apps, schema_editor):
+    from recipes.short_links import assign_codes
+
+    assign_codes(apps.get_model("recipes", "Recipe"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0009_recipe_image_variants"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="short_code",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=16,
+                null=True,
+                unique=True,
+                verbose_name="Код короткой ссылки",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="short_link_clicks",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Переходы по короткой ссылке"
+            ),
+        ),
+        migrations.RunPython(assign_short_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0011_timelineentry_recipe_author_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="popularity",
+            field=models.FloatField(default=0, verbose_name="Популярность"),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="trending",
+            field=models.FloatField(default=0, verbose_name="Рейтинг в тренде"),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-popularity", "-id"], name="recipe_popularity_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(fields=["-trending", "-id"], name="recipe_trending_idx"),
+        ),
+    ]
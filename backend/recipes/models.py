@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth import get_user_model
+from foodgram_backend.model_mixins import CounterFieldsMixin
 from ingredients.models import Ingredient
 
 User = get_user_model()
@@ -20,7 +22,40 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        # Теги подгружаются только по id, остальное берётся из справочника тегов
+        return self.select_related("author").prefetch_related(
+            Prefetch(
+                "ingredient_recipes",
+                queryset=IngredientRecipe.objects.select_related("ingredient"),
+            ),
+            Prefetch("tags", queryset=Tag.objects.only("id").order_by()),
+        )
+
+    def with_tags(self, tag_ids):
+        return self.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef("pk"), tag_id__in=tag_ids
+                )
+            )
+        )
+
+    # Флаги is_favorited и is_in_shopping_cart в выдаче считаются
+    # по множествам id из api.viewer_state, здесь — только фильтры по ним
+    def favorited_by(self, user, flag=True):
+        condition = Exists(Favorite.objects.filter(user=user, recipe=OuterRef("pk")))
+        return self.filter(condition if flag else ~condition)
+
+    def in_cart_of(self, user, flag=True):
+        condition = Exists(
+            ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+        )
+        return self.filter(condition if flag else ~condition)
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     COOKING_TIME_MIN = 1
     COOKING_TIME_MAX = 32000
 
@@ -29,6 +64,10 @@ class Recipe(models.Model):
     )
     name = models.CharField(max_length=200, verbose_name="Название")
     image = models.ImageField(upload_to="recipes/", verbose_name="Изображение")
+    # Уменьшенные копии изображения, строятся в фоне (api.images)
+    image_variants = models.JSONField(
+        default=dict, blank=True, verbose_name="Варианты изображения"
+    )
     text = models.TextField(verbose_name="Описание")
     cooking_time = models.PositiveSmallIntegerField(
         validators=[
@@ -42,9 +81,53 @@ class Recipe(models.Model):
     )
     tags = models.ManyToManyField(Tag, verbose_name="Теги")
     created = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    # Счётчики обновляются сигналами связей (recipes.counters),
+    # сверка: reconcile_counters
+    favorites_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество в избранном"
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество в корзинах"
+    )
+    # Рейтинги по избранному и корзинам с затуханием по времени,
+    # пересчитываются командой update_recipe_scores (recipes.ranking)
+    popularity = models.FloatField(default=0, verbose_name="Популярность")
+    trending = models.FloatField(default=0, verbose_name="Рейтинг в тренде")
+    # Код короткой ссылки /s/<код> (recipes.short_links)
+    short_code = models.CharField(
+        max_length=16,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Код короткой ссылки",
+    )
+    short_link_clicks = models.PositiveIntegerField(
+        default=0, verbose_name="Переходы по короткой ссылке"
+    )
+
+    # Пишутся сигналами связей, ranking.recompute и фоновой сборкой вариантов
+    protected_fields = (
+        "favorites_count",
+        "in_carts_count",
+        "short_link_clicks",
+        "popularity",
+        "trending",
+        "image_variants",
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ["-created"]
+        indexes = [
+            models.Index(fields=["-created", "-id"], name="recipe_created_id_idx"),
+            models.Index(
+                fields=["author", "-created", "-id"], name="recipe_author_created_idx"
+            ),
+            models.Index(fields=["-popularity", "-id"], name="recipe_popularity_idx"),
+            models.Index(fields=["-trending", "-id"], name="recipe_trending_idx"),
+        ]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
 
@@ -123,3 +206,52 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f"{self.user} добавил {self.recipe} в избранное"
+
+
+# Запись ленты подписок (recipes.timelines). Дата рецепта копируется в
+# запись, чтобы страница ленты читалась одним диапазоном индекса.
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="Пользователь",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name="Рецепт",
+    )
+    created = models.DateTimeField(verbose_name="Дата рецепта")
+
+    class Meta:
+        unique_together = ("user", "recipe")
+        indexes = [
+            models.Index(
+                fields=["user", "-created", "-recipe"], name="timeline_user_created_idx"
+            )
+        ]
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Ленты подписок"
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, verbose_name="Ингредиент"
+    )
+    amount = models.PositiveIntegerField(verbose_name="Количество")
+
+    class Meta:
+        unique_together = ("user", "ingredient")
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Списки покупок"
+
+    def __str__(self):
+        return f"{self.user}: {self.ingredient} — {self.amount}"
@@ -0,0 +1,81 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Favorite, Recipe, ShoppingCart
+
+BATCH_SIZE = 1000
+
+# bulk_update не отправляет post_save, поэтому о пересчёте рейтингов
+# кеши ответов узнают из этого сигнала
+scores_changed = Signal()
+
+
+# Вес добавлений в избранное и в корзину по интервалам времени:
+# (id рецепта, начало интервала, вес)
+def _events(since, trunc):
+    sources = (
+        (Favorite, settings.RECIPE_SCORE_FAVORITE_WEIGHT),
+        (ShoppingCart, settings.RECIPE_SCORE_CART_WEIGHT),
+    )
+    for model, weight in sources:
+        events = model.objects.order_by()
+        if since is not None:
+            events = events.filter(created_at__gte=since)
+        for recipe_id, start, count in (
+            events.annotate(start=trunc("created_at"))
+            .values_list("recipe_id", "start")
+            .annotate(count=Count("id"))
+        ):
+            yield recipe_id, start, count * weight
+
+
+# Каждое добавление весит тем меньше, чем оно старше: вдвое за half_life.
+# События группируются по интервалам width, возраст считается от середины.
+def _scores(now, half_life, width, trunc, since=None):
+    scores = defaultdict(float)
+    for recipe_id, start, weight in _events(since, trunc):
+        age = max(now - start - width / 2, timedelta(0))
+        scores[recipe_id] += weight * 0.5 ** (age / half_life)
+    return scores
+
+
+# Пересчитывает popularity и trending всех рецептов; запускается по расписанию
+# командой update_recipe_scores. Между запусками рейтинги не меняются, поэтому
+# сортировка по ним — чтение по индексу. Возвращает число изменённых рецептов.
+def recompute():
+    now = timezone.now()
+    popularity = _scores(
+        now,
+        timedelta(days=settings.RECIPE_POPULARITY_HALF_LIFE_DAYS),
+        timedelta(days=1),
+        TruncDay,
+    )
+    trending = _scores(
+        now,
+        timedelta(hours=settings.RECIPE_TRENDING_HALF_LIFE_HOURS),
+        timedelta(hours=1),
+        TruncHour,
+        since=now - timedelta(days=settings.RECIPE_TRENDING_WINDOW_DAYS),
+    )
+    changed = [
+        Recipe(pk=pk, popularity=popularity.get(pk, 0), trending=trending.get(pk, 0))
+        for pk, old_popularity, old_trending in Recipe.objects.values_list(
+            "pk", "popularity", "trending"
+        ).iterator(chunk_size=BATCH_SIZE)
+        if (old_popularity, old_trending)
+        != (popularity.get(pk, 0), trending.get(pk, 0))
+    ]
+    with transaction.atomic():
+        Recipe.objects.bulk_update(
+            changed, ["popularity", "trending"], batch_size=BATCH_SIZE
+        )
+        if changed:
+            scores_changed.send(sender=Recipe)
+    return len(changed)
@@ -0,0 +1,390 @@
+import difflib
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ingredients.models import Ingredient
+from .models import IngredientRecipe, Recipe, User
+
+TABLE = "recipes_search"
+# Поля документа в порядке убывания веса
+COLUMNS = ("name", "ingredients", "author", "text")
+WEIGHTS = {"name": 10.0, "ingredients": 4.0, "author": 2.0, "text": 1.0}
+PG_WEIGHTS = {"name": "A", "ingredients": "B", "author": "C", "text": "D"}
+# Поля автора, которые попадают в поисковый документ
+AUTHOR_FIELDS = {"username", "first_name", "last_name"}
+
+WORD_RE = re.compile(r"[^\W_]+")
+CYRILLIC_RE = re.compile(r"[а-я]+")
+
+# Стеммер Snowball для русского языка
+VOWELS = "аеиоуыэюя"
+# Группы окончаний: первая допустима только после «а» или «я», вторая — везде
+PERFECTIVE_GERUND = ("в вши вшись".split(), "ив ивши ившись ыв ывши ывшись".split())
+ADJECTIVE = (
+    [],
+    "ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых ую юю ая яя "
+    "ою ею".split(),
+)
+PARTICIPLE = ("ем нн вш ющ щ".split(), "ивш ывш ующ".split())
+REFLEXIVE = ([], "ся сь".split())
+VERB = (
+    "ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно".split(),
+    "ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено ят ует уют "
+    "ит ыт ены ить ыть ишь ую ю".split(),
+)
+NOUN = (
+    [],
+    "а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем ам ом о у ах "
+    "иях ях ы ь ию ью ю ия ья я".split(),
+)
+SUPERLATIVE = ("ейше", "ейш")
+DERIVATIONAL = ("ость", "ост")
+
+
+def _endings(groups):
+    endings = [(ending, True) for ending in groups[0]]
+    endings += [(ending, False) for ending in groups[1]]
+    return sorted(endings, key=lambda item: -len(item[0]))
+
+
+PERFECTIVE_GERUND, ADJECTIVE, PARTICIPLE, REFLEXIVE, VERB, NOUN = map(
+    _endings, (PERFECTIVE_GERUND, ADJECTIVE, PARTICIPLE, REFLEXIVE, VERB, NOUN)
+)
+
+
+def _remove(rv, endings):
+    for ending, after_a in endings:
+        if not rv.endswith(ending):
+            continue
+        start = len(rv) - len(ending)
+        if after_a and (start == 0 or rv[start - 1] not in "ая"):
+            continue
+        return rv[:start]
+    return None
+
+
+def _regions(word):
+    rv = r1 = r2 = len(word)
+    for index, char in enumerate(word):
+        if char in VOWELS:
+            rv = index + 1
+            break
+    for index in range(1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            r1 = index + 1
+            break
+    for index in range(r1 + 1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            r2 = index + 1
+            break
+    return rv, r2
+
+
+def stem(word):
+    word = word.lower().replace("ё", "е")
+    if not CYRILLIC_RE.fullmatch(word):
+        return word
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    removed = _remove(rv, PERFECTIVE_GERUND)
+    if removed is None:
+        reflexive = _remove(rv, REFLEXIVE)
+        if reflexive is not None:
+            rv = reflexive
+        removed = _remove(rv, ADJECTIVE)
+        if removed is not None:
+            participle = _remove(removed, PARTICIPLE)
+            if participle is not None:
+                removed = participle
+        else:
+            removed = _remove(rv, VERB)
+            if removed is None:
+                removed = _remove(rv, NOUN)
+    if removed is not None:
+        rv = removed
+
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    r2 = max(r2_start - rv_start, 0)
+    for ending in DERIVATIONAL:
+        if rv.endswith(ending) and len(rv) - len(ending) >= r2:
+            rv = rv[: -len(ending)]
+            break
+
+    superlative = next((ending for ending in SUPERLATIVE if rv.endswith(ending)), None)
+    if superlative:
+        rv = rv[: -len(superlative)]
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    elif superlative is None and rv.endswith("ь"):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+def stems(text):
+    return [stem(word) for word in WORD_RE.findall((text or "").lower())]
+
+
+def normalize(text):
+    return " ".join(stems(text))
+
+
+def _documents(recipe_ids):
+    ingredients = defaultdict(list)
+    for recipe_id, name in IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list("recipe_id", "ingredient__name"):
+        ingredients[recipe_id].append(name)
+    for row in Recipe.objects.filter(id__in=recipe_ids).values(
+        "id", "name", "text", "author__username", "author__first_name", "author__last_name"
+    ):
+        author = " ".join(
+            (row["author__username"], row["author__first_name"], row["author__last_name"])
+        )
+        yield row["id"], {
+            "name": normalize(row["name"]),
+            "ingredients": normalize(" ".join(ingredients[row["id"]])),
+            "author": normalize(author),
+            "text": normalize(row["text"]),
+        }
+
+
+# Индекс на FTS5: строки индекса совпадают по rowid с рецептами,
+# ранжирование по bm25 с весами полей.
+class SqliteIndex:
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} "
+            f"USING fts5({', '.join(COLUMNS)}, tokenize='unicode61')"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE}_vocab "
+            f"USING fts5vocab({TABLE}, 'row')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}_vocab")
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def delete(self, cursor, recipe_ids):
+        cursor.executemany(
+            f"DELETE FROM {TABLE} WHERE rowid = %s", [(pk,) for pk in recipe_ids]
+        )
+
+    def update(self, cursor, documents):
+        documents = list(documents)
+        self.delete(cursor, [pk for pk, _ in documents])
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, {', '.join(COLUMNS)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(COLUMNS))})",
+            [[pk] + [document[column] for column in COLUMNS] for pk, document in documents],
+        )
+
+    def filter(self, queryset, groups):
+        match = " AND ".join(
+            "(" + " OR ".join(f'"{term}"*' for term in group) + ")" for group in groups
+        )
+        weights = ", ".join(str(WEIGHTS[column]) for column in COLUMNS)
+        return queryset.extra(
+            select={"search_rank": f"bm25({TABLE}, {weights})"},
+            tables=[TABLE],
+            where=[f"{TABLE}.rowid = {Recipe._meta.db_table}.id", f"{TABLE} MATCH %s"],
+            params=[match],
+        )
+
+    def vocabulary(self, cursor):
+        cursor.execute(f"SELECT term FROM {TABLE}_vocab")
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Индекс на tsvector: основы слов уже получены стеммером, поэтому
+# используется конфигурация simple; поля взвешены метками A–D.
+class PostgresIndex:
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+            f"recipe_id bigint PRIMARY KEY REFERENCES recipes_recipe (id) "
+            f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            f"document tsvector NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx "
+            f"ON {TABLE} USING gin (document)"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def delete(self, cursor, recipe_ids):
+        cursor.execute(
+            f"DELETE FROM {TABLE} WHERE recipe_id = ANY(%s)", [list(recipe_ids)]
+        )
+
+    def update(self, cursor, documents):
+        vector = " || ".join(
+            f"setweight(to_tsvector('simple', %s), '{PG_WEIGHTS[column]}')"
+            for column in COLUMNS
+        )
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (recipe_id, document) VALUES (%s, {vector}) "
+            f"ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document",
+            [[pk] + [document[column] for column in COLUMNS] for pk, document in documents],
+        )
+
+    def filter(self, queryset, groups):
+        query = " & ".join(
+            "(" + " | ".join(f"{term}:*" for term in group) + ")" for group in groups
+        )
+        return queryset.extra(
+            select={
+                "search_rank": f"-ts_rank({TABLE}.document, to_tsquery('simple', %s))"
+            },
+            select_params=[query],
+            tables=[TABLE],
+            where=[
+                f"{TABLE}.recipe_id = {Recipe._meta.db_table}.id",
+                f"{TABLE}.document @@ to_tsquery('simple', %s)",
+            ],
+            params=[query],
+        )
+
+    def vocabulary(self, cursor):
+        cursor.execute(f"SELECT word FROM ts_stat('SELECT document FROM {TABLE}')")
+        return [row[0] for row in cursor.fetchall()]
+
+
+INDEXES = {"sqlite": SqliteIndex, "postgresql": PostgresIndex}
+
+
+def get_index(vendor=None):
+    index = INDEXES.get(vendor or connection.vendor)
+    return index() if index else None
+
+
+# Словарь основ для исправления опечаток. Перечитывается не чаще раза
+# в RECIPE_SEARCH_VOCABULARY_TTL секунд: опечатки допустимо исправлять
+# по слегка устаревшему словарю.
+class Vocabulary:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._words = set()
+        self._buckets = {}
+
+    def _ensure_fresh(self, index):
+        ttl = settings.RECIPE_SEARCH_VOCABULARY_TTL
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < ttl:
+            return
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < ttl:
+                return
+            with connection.cursor() as cursor:
+                words = set(index.vocabulary(cursor))
+            buckets = defaultdict(list)
+            for word in words:
+                buckets[word[0]].append(word)
+            self._words, self._buckets = words, dict(buckets)
+            self._loaded_at = time.monotonic()
+
+    def variants(self, index, term):
+        self._ensure_fresh(index)
+        if term in self._words or len(term) < 4:
+            return [term]
+        # Кандидаты с той же первой буквой и близкой длиной
+        candidates = [
+            word
+            for word in self._buckets.get(term[0], ())
+            if abs(len(word) - len(term)) <= 2
+        ]
+        return [term] + difflib.get_close_matches(term, candidates, n=3, cutoff=0.75)
+
+    def reset(self):
+        self._loaded_at = None
+
+
+vocabulary = Vocabulary()
+
+
+# Оставляет рецепты, подходящие под запрос, присоединяя к ним строки индекса.
+# Релевантность попадает в столбец search_rank: чем меньше, тем выше рецепт.
+# Сортировка и пагинация выполняются в том же запросе к базе.
+# Если бэкенд базы не поддерживается, возвращает None.
+def filter_recipes(queryset, text):
+    index = get_index()
+    if index is None:
+        return None
+    terms = [term for term in dict.fromkeys(stems(text)) if term]
+    if not terms:
+        return queryset.none()
+    groups = [vocabulary.variants(index, term) for term in terms]
+    return index.filter(queryset, groups)
+
+
+def index_recipes(recipe_ids):
+    index = get_index()
+    if index is None or not recipe_ids:
+        return
+    recipe_ids = list(recipe_ids)
+    with transaction.atomic(), connection.cursor() as cursor:
+        documents = list(_documents(recipe_ids))
+        index.update(cursor, documents)
+        found = {pk for pk, _ in documents}
+        index.delete(cursor, [pk for pk in recipe_ids if pk not in found])
+
+
+def rebuild(batch_size=1000):
+    index = get_index()
+    if index is None:
+        return 0
+    with connection.cursor() as cursor:
+        index.drop(cursor)
+        index.create(cursor)
+    recipe_ids = list(Recipe.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(recipe_ids), batch_size):
+        index_recipes(recipe_ids[start:start + batch_size])
+    vocabulary.reset()
+    return len(recipe_ids)
+
+
+def schedule(recipe_ids):
+    recipe_ids = set(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: index_recipes(recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    schedule([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredient_changed(instance, **kwargs):
+    schedule([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(instance, created, **kwargs):
+    if not created:
+        schedule(
+            IngredientRecipe.objects.filter(ingredient_id=instance.pk).values_list(
+                "recipe_id", flat=True
+            )
+        )
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields, **kwargs):
+    if created or (update_fields is not None and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    schedule(instance.recipes.values_list("id", flat=True))
@@ -0,0 +1,207 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import QuerySet, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+# Сколько раз повторять изменение, если параллельный запрос первым
+# создал ту же позицию списка
+APPLY_ATTEMPTS = 3
+
+
+def recipe_amounts(recipe):
+    return dict(
+        IngredientRecipe.objects.filter(recipe=recipe).values_list(
+            "ingredient_id", "amount"
+        )
+    )
+
+
+# Строк, которых ещё нет, select_for_update не блокирует: два первых
+# добавления одного ингредиента вставят одну позицию дважды. Проигравший
+# получает IntegrityError, откатывает точку сохранения и повторяет
+# изменение уже поверх вставленной строки.
+def _apply(user_ids, deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not user_ids or not deltas:
+        return
+    for attempt in range(APPLY_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                _apply_once(user_ids, deltas)
+            return
+        except IntegrityError:
+            if attempt == APPLY_ATTEMPTS - 1:
+                raise
+
+
+def _apply_once(user_ids, deltas):
+    existing = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id__in=user_ids, ingredient_id__in=deltas
+        )
+    }
+    to_create, to_update, to_delete = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, delta in deltas.items():
+            item = existing.get((user_id, ingredient_id))
+            if item is None:
+                if delta > 0:
+                    to_create.append(
+                        ShoppingListItem(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=delta,
+                        )
+                    )
+                continue
+            item.amount += delta
+            if item.amount > 0:
+                to_update.append(item)
+            else:
+                to_delete.append(item.pk)
+    ShoppingListItem.objects.bulk_create(to_create)
+    ShoppingListItem.objects.bulk_update(to_update, ["amount"])
+    if to_delete:
+        ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+def add_recipe(user_id, recipe):
+    _apply([user_id], recipe_amounts(recipe))
+
+
+def remove_recipe(user_id, recipe):
+    _apply(
+        [user_id],
+        {key: -amount for key, amount in recipe_amounts(recipe).items()},
+    )
+
+
+# Переносит изменение состава рецепта в списки всех, у кого он в корзине
+def change_recipe(recipe, old_amounts, new_amounts):
+    deltas = {
+        key: new_amounts.get(key, 0) - old_amounts.get(key, 0)
+        for key in old_amounts.keys() | new_amounts.keys()
+    }
+    user_ids = list(
+        ShoppingCart.objects.filter(recipe=recipe).values_list("user_id", flat=True)
+    )
+    _apply(user_ids, deltas)
+
+
+def compute(user_ids=None):
+    if user_ids is None:
+        rows = IngredientRecipe.objects.filter(recipe__in_shopping_cart__isnull=False)
+    else:
+        rows = IngredientRecipe.objects.filter(
+            recipe__in_shopping_cart__user__in=user_ids
+        )
+    rows = (
+        rows.values("recipe__in_shopping_cart__user", "ingredient")
+        .annotate(total=Sum("amount"))
+        .order_by()
+    )
+    result = defaultdict(dict)
+    for row in rows.iterator():
+        result[row["recipe__in_shopping_cart__user"]][row["ingredient"]] = row["total"]
+    return result
+
+
+def stored(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    result = defaultdict(dict)
+    for user_id, ingredient_id, amount in items.values_list(
+        "user_id", "ingredient_id", "amount"
+    ).iterator():
+        result[user_id][ingredient_id] = amount
+    return result
+
+
+def rebuild(user_ids=None, batch_size=5000):
+    with transaction.atomic():
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=amount
+                )
+                for user_id, amounts in compute(user_ids).items()
+                for ingredient_id, amount in amounts.items()
+            ),
+            batch_size=batch_size,
+        )
+
+
+def verify(user_ids=None):
+    expected = compute(user_ids)
+    actual = stored(user_ids)
+    return sorted(
+        user_id
+        for user_id in expected.keys() | actual.keys()
+        if expected.get(user_id, {}) != actual.get(user_id, {})
+    )
+
+
+# Списки ведутся сигналами корзины и состава рецептов, поэтому учитываются
+# изменения из админки и каскадные удаления. bulk_create и bulk_update
+# сигналов не отправляют: такие изменения переносит change_recipe.
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_created(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add_recipe(instance.user_id, instance.recipe_id)
+
+
+# pre_delete: при удалении рецепта его состав удаляется в том же каскаде,
+# а до удаления строк сигналы pre_delete получают все объекты
+@receiver(pre_delete, sender=ShoppingCart)
+def cart_item_deleted(instance, **kwargs):
+    remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_save, sender=IngredientRecipe)
+def remember_ingredient(instance, raw=False, **kwargs):
+    instance._stored_row = None
+    if instance.pk is not None and not raw:
+        instance._stored_row = (
+            IngredientRecipe.objects.filter(pk=instance.pk)
+            .values_list("recipe_id", "ingredient_id", "amount")
+            .first()
+        )
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def ingredient_saved(instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_amounts = {}
+    stored = getattr(instance, "_stored_row", None)
+    if stored is not None:
+        recipe_id, ingredient_id, amount = stored
+        if recipe_id == instance.recipe_id:
+            old_amounts = {ingredient_id: amount}
+        else:
+            change_recipe(recipe_id, {ingredient_id: amount}, {})
+    change_recipe(
+        instance.recipe_id, old_amounts, {instance.ingredient_id: instance.amount}
+    )
+
+
+# Удаление рецепта убирает его из корзин целиком (cart_item_deleted), а
+# удаление ингредиента удаляет и его позиции списков, поэтому здесь
+# учитываются только удаления самих строк состава
+@receiver(post_delete, sender=IngredientRecipe)
+def ingredient_deleted(instance, origin=None, **kwargs):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if model is IngredientRecipe:
+        change_recipe(
+            instance.recipe_id, {instance.ingredient_id: instance.amount}, {}
+        )
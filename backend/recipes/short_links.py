@@ -0,0 +1,137 @@
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram_backend.db_routing import primary
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+BASE62 = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+CODE_KEY = "recipes:short-link:{}"
+# Сколько помнить, что кода нет: защищает базу от перебора кодов
+MISSING_TIMEOUT = 60
+
+
+# Код — id рецепта в base62 с алфавитом, перемешанным по SHORT_LINK_SALT,
+# поэтому коды короткие и не выдают порядковые номера напрямую. Соль
+# задаётся один раз: коды хранятся в рецептах и не пересчитываются.
+def _alphabet():
+    alphabet = list(BASE62)
+    random.Random(settings.SHORT_LINK_SALT).shuffle(alphabet)
+    return "".join(alphabet)
+
+
+def encode(number):
+    alphabet = _alphabet()
+    code = ""
+    while True:
+        number, digit = divmod(number, len(alphabet))
+        code = alphabet[digit] + code
+        if not number:
+            return code
+
+
+# Коды рецептам, созданным в обход сигналов (миграции, bulk_create)
+def assign_codes(model=Recipe):
+    recipes = [
+        model(pk=pk, short_code=encode(pk))
+        for pk in model.objects.filter(short_code__isnull=True).values_list(
+            "pk", flat=True
+        )
+    ]
+    model.objects.bulk_update(recipes, ["short_code"], batch_size=1000)
+
+
+# id рецепта по коду из кеша; рецепт из базы не читается
+def resolve(code):
+    key = CODE_KEY.format(code)
+    recipe_id = cache.get(key)
+    if recipe_id is None:
+        with primary():
+            recipe_id = (
+                Recipe.objects.filter(short_code=code)
+                .values_list("pk", flat=True)
+                .first()
+            )
+        if recipe_id is None:
+            cache.set(key, 0, MISSING_TIMEOUT)
+        else:
+            cache.set(key, recipe_id, timeout=None)
+    return recipe_id or None
+
+
+# Переходы по коротким ссылкам копятся в памяти процесса и записываются
+# одним UPDATE, когда набралось SHORT_LINK_FLUSH_CLICKS переходов или прошло
+# SHORT_LINK_FLUSH_SECONDS с прошлой записи. Остаток пишется при выходе.
+class ClickCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def add(self, recipe_id):
+        with self._lock:
+            self._counts[recipe_id] += 1
+            self._pending += 1
+            due = (
+                self._pending >= settings.SHORT_LINK_FLUSH_CLICKS
+                or time.monotonic() - self._flushed_at >= settings.SHORT_LINK_FLUSH_SECONDS
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._pending = 0
+            self._flushed_at = time.monotonic()
+        if not counts:
+            return
+        increment = Case(
+            *(When(pk=pk, then=Value(count)) for pk, count in counts.items()),
+            output_field=PositiveIntegerField(),
+        )
+        try:
+            Recipe.objects.filter(pk__in=counts).update(
+                short_link_clicks=F("short_link_clicks") + increment
+            )
+        except DatabaseError:
+            logger.exception("Не удалось записать переходы по коротким ссылкам")
+            with self._lock:
+                self._counts.update(counts)
+                self._pending += sum(counts.values())
+
+
+click_counter = ClickCounter()
+atexit.register(click_counter.flush)
+
+
+@receiver(post_save, sender=Recipe)
+def assign_short_code(instance, created, **kwargs):
+    if not created or instance.short_code:
+        return
+    instance.short_code = encode(instance.pk)
+    Recipe.objects.filter(pk=instance.pk).update(short_code=instance.short_code)
+    # Код мог быть запрошен до появления рецепта и запомнен как отсутствующий
+    transaction.on_commit(
+        lambda: cache.set(CODE_KEY.format(instance.short_code), instance.pk, None)
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_short_code(instance, **kwargs):
+    if instance.short_code:
+        transaction.on_commit(lambda: cache.delete(CODE_KEY.format(instance.short_code)))
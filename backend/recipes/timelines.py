@@ -0,0 +1,183 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from users.models import Subscription
+from .models import Recipe, TimelineEntry, User
+
+BATCH_SIZE = 1000
+
+
+# Ленты подписок. Новый рецепт раскладывается по лентам подписчиков автора,
+# и страница ленты читается одним диапазоном индекса. Рецепты авторов, у которых
+# не меньше FEED_FANOUT_MAX_SUBSCRIBERS подписчиков, по лентам не раскладываются:
+# они подмешиваются при чтении из индекса рецептов по автору.
+def fans_out(author):
+    return author.subscribers_count < settings.FEED_FANOUT_MAX_SUBSCRIBERS
+
+
+def _insert(entries):
+    entries = iter(entries)
+    created = 0
+    while batch := list(islice(entries, BATCH_SIZE)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+    return created
+
+
+# Раскладывает рецепт по лентам подписчиков; выполняется в фоне после создания
+def publish(recipe_id):
+    recipe = Recipe.objects.select_related("author").filter(pk=recipe_id).first()
+    if recipe is None or not fans_out(recipe.author):
+        return
+    subscribers = Subscription.objects.filter(author_id=recipe.author_id).values_list(
+        "user_id", flat=True
+    )
+    _insert(
+        TimelineEntry(user_id=user_id, recipe_id=recipe.pk, created=recipe.created)
+        for user_id in subscribers
+    )
+
+
+# При подписке в ленту попадают последние FEED_BACKFILL_RECIPES рецептов автора
+def follow(user_id, author):
+    if not fans_out(author):
+        return
+    recipes = (
+        Recipe.objects.filter(author=author)
+        .order_by("-created", "-id")
+        .values_list("pk", "created")[: settings.FEED_BACKFILL_RECIPES]
+    )
+    _insert(
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id, created=created)
+        for recipe_id, created in recipes
+    )
+
+
+# Раскладывает последние рецепты автора по лентам всех его подписчиков
+def backfill_author(author_id):
+    recipes = list(
+        Recipe.objects.filter(author_id=author_id)
+        .order_by("-created", "-id")
+        .values_list("pk", "created")[: settings.FEED_BACKFILL_RECIPES]
+    )
+    if not recipes:
+        return 0
+    subscribers = Subscription.objects.filter(author_id=author_id).values_list(
+        "user_id", flat=True
+    )
+    return _insert(
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id, created=created)
+        for user_id in subscribers.iterator(chunk_size=BATCH_SIZE)
+        for recipe_id, created in recipes
+    )
+
+
+# Пока автор был популярным, его рецепты в ленты не раскладывались. Когда
+# подписчиков становится меньше порога, read перестаёт подмешивать его
+# рецепты, поэтому ленты подписчиков дополняются сразу после коммита.
+# Счётчик к этому моменту мог быть уменьшен или ещё нет (порядок
+# обработчиков не задан), поэтому он лишь отсекает далёкие от порога
+# значения, а переход проверяется точным числом подписок. При параллельных
+# отписках досоздание может выполниться дважды, повторы пропускаются.
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(instance, **kwargs):
+    threshold = settings.FEED_FANOUT_MAX_SUBSCRIBERS
+    counter = (
+        User.objects.filter(pk=instance.author_id)
+        .values_list("subscribers_count", flat=True)
+        .first()
+    )
+    if counter is None or not threshold - 1 <= counter <= threshold:
+        return
+    if Subscription.objects.filter(author_id=instance.author_id).count() == (
+        threshold - 1
+    ):
+        author_id = instance.author_id
+        transaction.on_commit(lambda: backfill_author(author_id))
+
+
+def unfollow(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, recipe__author_id=author_id).delete()
+
+
+def _window(queryset, key, size, position, reverse):
+    lookup = "gt" if reverse else "lt"
+    if position is not None:
+        created, pk = position
+        queryset = queryset.filter(
+            Q(**{f"created__{lookup}": created})
+            | Q(created=created, **{f"{key}__{lookup}": pk})
+        )
+    order = ("created", key) if reverse else ("-created", f"-{key}")
+    return list(queryset.order_by(*order).values_list("created", key)[:size])
+
+
+# id рецептов страницы ленты от позиции (created, id) — дальше в прошлое,
+# а при reverse — к новым. Записи ленты и рецепты популярных авторов
+# читаются двумя запросами и сливаются по позиции. Рецепты автора, который
+# стал популярным, могут быть и в ленте; повторы пропускаются при слиянии,
+# и оно идёт, пока не наберётся size разных id. Каждый источник читается
+# на size строк без повторов внутри себя, поэтому до конца любого из них
+# слияние уже даёт size разных id в правильном порядке.
+def read(user, size, position=None, reverse=False):
+    entries = _window(
+        TimelineEntry.objects.filter(user=user), "recipe_id", size, position, reverse
+    )
+    popular = Subscription.objects.filter(
+        user=user, author__subscribers_count__gte=settings.FEED_FANOUT_MAX_SUBSCRIBERS
+    ).values("author_id")
+    recipes = _window(
+        Recipe.objects.filter(author_id__in=popular), "id", size, position, reverse
+    )
+    ids = []
+    seen = set()
+    for _, recipe_id in heapq.merge(entries, recipes, reverse=not reverse):
+        if recipe_id in seen:
+            continue
+        seen.add(recipe_id)
+        ids.append(recipe_id)
+        if len(ids) == size:
+            break
+    return ids
+
+
+# Пересобирает ленты по подпискам. Нужна после загрузки данных в обход
+# представлений и сигналов. Возвращает число записей.
+def rebuild(user_ids=None):
+    subscriptions = Subscription.objects.filter(
+        author__subscribers_count__lt=settings.FEED_FANOUT_MAX_SUBSCRIBERS
+    )
+    entries = TimelineEntry.objects.all()
+    if user_ids is not None:
+        subscriptions = subscriptions.filter(user_id__in=user_ids)
+        entries = entries.filter(user_id__in=user_ids)
+    recent = {}
+    for author_id, recipe_id, created in (
+        Recipe.objects.filter(author_id__in=subscriptions.values("author_id"))
+        .annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F("author_id"),
+                order_by=(F("created").desc(), F("id").desc()),
+            )
+        )
+        .filter(position__lte=settings.FEED_BACKFILL_RECIPES)
+        .values_list("author_id", "id", "created")
+    ):
+        recent.setdefault(author_id, []).append((recipe_id, created))
+    with transaction.atomic():
+        entries.delete()
+        return _insert(
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id, created=created)
+            for user_id, author_id in subscriptions.values_list(
+                "user_id", "author_id"
+            ).iterator(chunk_size=BATCH_SIZE)
+            for recipe_id, created in recent.get(author_id, ())
+        )
@@ -0,0 +1,8 @@
+#!/bin/sh
+# Запуск gunicorn в режиме SERVER_MODE: wsgi (по умолчанию) или asgi.
+# Число воркеров задаётся переменной WEB_CONCURRENCY.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    exec gunicorn foodgram_backend.asgi:application \
+        --worker-class uvicorn_worker.UvicornWorker --bind 0.0.0.0:8000
+fi
+exec gunicorn foodgram_backend.wsgi:application --bind 0.0.0.0:8000
@@ -0,0 +1,59 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.IMAGE_BROKER = "api.images.ImmediateBroker"
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+    # Хранилище LocMemCache общее для процесса, а версии справочников
+    # и индексов не должны переживать откат базы после теста
+    cache.clear()
+
+
+@pytest.fixture
+def make_user(db):
+    def make(name):
+        return User.objects.create_user(
+            email=f"{name}@example.com",
+            username=name,
+            first_name=name,
+            last_name=name,
+            password="password-12345",
+        )
+
+    return make
+
+
+# Индексы и кеши обновляются после коммита, а тест идёт в одной транзакции
+@pytest.fixture
+def make_recipe(db, django_capture_on_commit_callbacks):
+    def make(author, name, text="Описание"):
+        with django_capture_on_commit_callbacks(execute=True):
+            return Recipe.objects.create(
+                author=author,
+                name=name,
+                text=text,
+                cooking_time=10,
+                image="recipes/test.png",
+            )
+
+    return make
+
+
+@pytest.fixture
+def client_for():
+    def make(user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+
+    return make
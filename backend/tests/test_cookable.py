@@ -0,0 +1,55 @@
+import pytest
+
+from api.pagination import RankedPagination
+from ingredients.models import Ingredient
+from recipes.cookable import cookable_index
+from recipes.models import IngredientRecipe
+
+
+@pytest.fixture
+def pantry(make_user, make_recipe, django_capture_on_commit_callbacks):
+    author = make_user("author")
+    ingredients = [
+        Ingredient.objects.create(name=f"ингредиент {index}", measurement_unit="г")
+        for index in range(4)
+    ]
+    with django_capture_on_commit_callbacks(execute=True):
+        for index in range(12):
+            recipe = make_recipe(author, f"Рецепт {index}")
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+                for ingredient in ingredients[: index % 4 + 1]
+            )
+        cookable_index.invalidate()
+    return ingredients[:2]
+
+
+def test_rank_pages_match_full_ranking(pantry):
+    ids = [ingredient.pk for ingredient in pantry]
+    count, ranked = cookable_index.rank(ids)
+
+    assert count == len(ranked) == 12
+    assert [missing for _, missing in ranked] == sorted(
+        missing for _, missing in ranked
+    )
+    for offset in range(0, 13, 5):
+        assert cookable_index.rank(ids, offset=offset, limit=5) == (
+            count,
+            ranked[offset:][:5],
+        )
+
+
+def test_cookable_limit_is_capped(pantry, client_for, monkeypatch):
+    ids = ",".join(str(ingredient.pk) for ingredient in pantry)
+    response = client_for().get(f"/api/recipes/cookable/?ingredients={ids}&limit=5")
+
+    assert response.status_code == 200
+    assert response.data["count"] == 12
+    assert len(response.data["results"]) == 5
+    assert response.data["results"][0]["missing_ingredients"] == 0
+
+    monkeypatch.setattr(RankedPagination, "max_limit", 3)
+    response = client_for().get(
+        f"/api/recipes/cookable/?ingredients={ids}&limit=100000"
+    )
+    assert len(response.data["results"]) == 3
@@ -0,0 +1,48 @@
+import pytest
+
+
+@pytest.fixture
+def recipes(make_user, make_recipe):
+    author = make_user("author")
+    return [
+        make_recipe(author, "Борщ с фасолью", "борщ борщ борщ"),
+        make_recipe(author, "Суп", "почти борщ"),
+        make_recipe(author, "Салат", "овощи"),
+    ]
+
+
+def test_cursor_mode_follows_default_ordering(recipes, client_for):
+    response = client_for().get("/api/recipes/?pagination=cursor&limit=2")
+
+    assert response.status_code == 200
+    assert [item["id"] for item in response.data["results"]] == [
+        recipes[2].pk,
+        recipes[1].pk,
+    ]
+    following = client_for().get(response.data["next"])
+    assert [item["id"] for item in following.data["results"]] == [recipes[0].pk]
+
+
+def test_search_is_ranked_without_cursor(recipes, client_for):
+    response = client_for().get("/api/recipes/?search=борщ")
+
+    assert response.status_code == 200
+    assert [item["id"] for item in response.data["results"]] == [
+        recipes[0].pk,
+        recipes[1].pk,
+    ]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "search=борщ&pagination=cursor",
+        "search=борщ&cursor=WzAsIFtdXQ==",
+        "ordering=-popularity&pagination=cursor",
+    ],
+)
+def test_cursor_mode_rejects_other_orderings(recipes, client_for, query):
+    response = client_for().get(f"/api/recipes/?{query}")
+
+    assert response.status_code == 400
+    assert "cursor" in response.data
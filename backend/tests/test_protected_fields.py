@@ -0,0 +1,34 @@
+from api import stored_files
+from api.models import StoredFile
+from recipes.models import Recipe
+from users.models import User
+
+VARIANTS = {"source": "recipes/test.png", "sizes": {"card": {"webp": "v/card.webp"}}}
+
+
+def test_full_save_keeps_fields_written_in_background(make_user, make_recipe):
+    recipe = make_recipe(make_user("author"), "Борщ")
+    stale = Recipe.objects.get(pk=recipe.pk)
+    Recipe.objects.filter(pk=recipe.pk).update(
+        popularity=2.5, trending=1.5, favorites_count=3, image_variants=VARIANTS
+    )
+    stored_files.acquire(stored_files.variant_names(VARIANTS))
+
+    stale.name = "Щи"
+    stale.save()
+
+    recipe.refresh_from_db()
+    assert recipe.name == "Щи"
+    assert (recipe.popularity, recipe.trending, recipe.favorites_count) == (2.5, 1.5, 3)
+    assert recipe.image_variants == VARIANTS
+    assert StoredFile.objects.get(name="v/card.webp").references == 1
+
+
+def test_full_save_keeps_avatar_variants(make_user):
+    stale = make_user("viewer")
+    User.objects.filter(pk=stale.pk).update(avatar_variants=VARIANTS)
+
+    stale.set_password("another-password-1")
+    stale.save()
+
+    assert User.objects.get(pk=stale.pk).avatar_variants == VARIANTS
@@ -0,0 +1,58 @@
+import pytest
+
+from recipes import timelines
+from recipes.models import TimelineEntry
+from users.models import Subscription, User
+
+
+@pytest.fixture
+def feed(settings, make_user, make_recipe):
+    settings.FEED_FANOUT_MAX_SUBSCRIBERS = 2
+    viewer, other = make_user("viewer"), make_user("other")
+    popular, regular = make_user("popular"), make_user("regular")
+    for author in (popular, regular):
+        Subscription.objects.create(user=viewer, author=author)
+        timelines.follow(viewer.pk, author)
+
+    # Пока у автора один подписчик, его рецепты раскладываются по лентам
+    recipes = []
+    for index in range(4):
+        for author in (popular, regular):
+            recipe = make_recipe(author, f"{author.username} {index}")
+            timelines.publish(recipe.pk)
+            recipes.append(recipe)
+    # Со вторым подписчиком автор становится популярным: старые рецепты
+    # есть и в ленте, и в выборке по автору, новые — только в выборке
+    Subscription.objects.create(user=other, author=popular)
+    for index in range(4, 7):
+        recipes.append(make_recipe(popular, f"popular {index}"))
+    return viewer, [recipe.pk for recipe in reversed(recipes)]
+
+
+def test_read_fills_pages_despite_duplicates(feed):
+    viewer, expected = feed
+    popular = User.objects.get(username="popular")
+    assert popular.subscribers_count == 2
+    assert (
+        TimelineEntry.objects.filter(user=viewer, recipe__author=popular).count() == 4
+    )
+
+    assert timelines.read(viewer, 5) == expected[:5]
+    assert timelines.read(viewer, len(expected) + 5) == expected
+
+
+def test_feed_pages_are_full_and_complete(feed, client_for):
+    viewer, expected = feed
+    client = client_for(viewer)
+    seen = []
+    url = "/api/recipes/feed/?limit=3"
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = [item["id"] for item in response.data["results"]]
+        seen += page
+        url = response.data["next"]
+        if url:
+            assert len(page) == 3
+
+    assert seen == expected
@@ -3,8 +3,12 @@ from .models import User, Subscription
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff')
+    list_display = (
+        'username', 'email', 'first_name', 'last_name', 'is_staff',
+        'recipes_count', 'subscribers_count',
+    )
     search_fields = ('username', 'email', 'first_name', 'last_name')
+    readonly_fields = ('recipes_count', 'subscribers_count', 'avatar_variants')
 
 
 admin.site.register(User, UserAdmin)
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_alter_subscription_options_alter_user_options"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="subscription_user_created_idx",
+            ),
+        ),
+    ]
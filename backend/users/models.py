@@ -2,12 +2,26 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
 
+from foodgram_backend.model_mixins import CounterFieldsMixin
 
-class User(AbstractUser):
+
+class User(CounterFieldsMixin, AbstractUser):
     email = models.EmailField(unique=True, max_length=254)
     first_name = models.CharField(max_length=150)
     last_name = models.CharField(max_length=150)
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
+    # Уменьшенные копии аватара, строятся в фоне (api.images)
+    avatar_variants = models.JSONField(default=dict, blank=True)
+    # Счётчики обновляются сигналами связей (recipes.counters),
+    # сверка: reconcile_counters
+    recipes_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество рецептов"
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество подписчиков"
+    )
+
+    protected_fields = ("recipes_count", "subscribers_count", "avatar_variants")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
@@ -33,6 +47,12 @@ class Subscription(models.Model):
     class Meta:
         unique_together = ("user", "author")
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="subscription_user_created_idx",
+            )
+        ]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
 